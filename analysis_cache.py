@@ -0,0 +1,84 @@
+"""
+Persistent cache of LLM difference-analysis responses.
+
+Entries are keyed by a hash of (analysis model, rendered analysis prompt,
+FINETUNING_DATA), so re-running llm_difference_analyzer.py only pays for pairs
+whose prompt, context or model changed. The raw response text is stored, so
+parser fixes apply to cached entries too. Backed by a single SQLite file that
+is safe to share between worker threads.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_FILE = "analysis_cache.sqlite"
+
+
+def analysis_cache_key(model: str, analysis_prompt: str, finetuning_data: str = None) -> str:
+    """Content hash identifying one analysis request."""
+    h = hashlib.sha256()
+    for part in (model, analysis_prompt, finetuning_data or ""):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class AnalysisCache:
+    """SQLite-backed response cache with hit/miss counters."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_FILE):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_model ON responses (model)")
+
+    def get(self, key: str):
+        """Return the cached response text, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at) VALUES (?, ?, ?, ?)",
+                (key, model, response, time.time()),
+            )
+
+    def invalidate(self, model: str = None) -> int:
+        """Delete entries for one model (or every entry if model is None); returns the count."""
+        with self._lock, self._conn:
+            if model is None:
+                cursor = self._conn.execute("DELETE FROM responses")
+            else:
+                cursor = self._conn.execute("DELETE FROM responses WHERE model = ?", (model,))
+            return cursor.rowcount
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = f" ({self.hits / total:.0%} hit rate)" if total else ""
+        return f"{self.hits} hits, {self.misses} misses{rate}"
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,249 @@
+# ABOUTME: Background loading and hot reload of the Drift Explorer data files
+# ABOUTME: Discovers prompts_*.json in mocks/, loads them in parallel and swaps in complete snapshots
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from detail_store import DETAIL_CACHE_DIR
+from prompt_store import ComparisonData, SharedPromptTable, load_comparison
+
+COMPARISON_PREFIX = "prompts_"
+POLL_INTERVAL = 2.0
+LOAD_WORKERS = 4
+# Share of the prompt table no comparison refers to any more (left behind by
+# edited or removed files) above which a reload rebuilds the table from scratch
+MAX_ORPHANED_FRACTION = 0.25
+
+
+@dataclass
+class DataSnapshot:
+    """
+    Everything the API serves, built from one consistent set of files.
+
+    A snapshot is complete before it is published and is never modified
+    afterwards, apart from prompt_list_bytes, which only memoizes encoded
+    responses, and table, which later reloads only append rows to. Request handlers read DataLoader.snapshot once and use that
+    object throughout, so a reload can never be observed half-way.
+    """
+    comparisons_by_id: dict[str, ComparisonData] = field(default_factory=dict)
+    # Shared by every comparison loaded since the table was last rebuilt
+    table: SharedPromptTable = field(default_factory=SharedPromptTable)
+    clusters_data: dict = field(default_factory=dict)
+    comparisons_data: dict = field(default_factory=dict)
+    # Encoded /api/prompts bodies keyed by (comparison, cluster_1, cluster_2, cluster_3)
+    prompt_list_bytes: dict[tuple, bytes] = field(default_factory=dict)
+    loaded_at: float = 0.0
+
+
+def discover_comparison_files(mocks_dir: Path) -> dict[str, Path]:
+    """Map each prompts_<id>.json in mocks_dir to its comparison id."""
+    return {
+        path.stem[len(COMPARISON_PREFIX):]: path
+        for path in sorted(Path(mocks_dir).glob(f"{COMPARISON_PREFIX}*.json"))
+    }
+
+
+def _file_signature(path: Path) -> Optional[tuple]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _orphaned_fraction(snapshot: DataSnapshot) -> float:
+    """Share of snapshot.table rows that none of its comparisons refer to."""
+    table = snapshot.table
+    if not len(table):
+        return 0.0
+    referenced = set()
+    for comparison_data in snapshot.comparisons_by_id.values():
+        if comparison_data.table is table:
+            referenced.update(comparison_data.rows)
+    return 1.0 - len(referenced) / len(table)
+
+
+class DataLoader:
+    """
+    Loads comparison, cluster and comparison-metadata files off the request path.
+
+    start() loads every file in a background thread, comparison files in
+    parallel, then polls the files' sizes and modification times. When
+    something changes, only the changed files are loaded, into a new snapshot
+    that reuses the unchanged comparisons and the shared prompt table, and the
+    snapshot reference is replaced in one assignment. The table is only
+    appended to, so published snapshots are unaffected; once more than
+    MAX_ORPHANED_FRACTION of it is no longer referenced, every file is
+    reloaded into a fresh table instead. A file that fails to load (for example one
+    that is still being written) keeps its previous version and is reported
+    in errors until it changes again.
+    """
+
+    def __init__(
+        self,
+        mocks_dir: Path,
+        cache_dir: Path = DETAIL_CACHE_DIR,
+        poll_interval: float = POLL_INTERVAL,
+        max_workers: int = LOAD_WORKERS,
+        prepare: Optional[Callable[[DataSnapshot], None]] = None,
+    ):
+        """
+        Args:
+            mocks_dir: Directory holding prompts_*.json, clusters.json and comparisons.json
+            cache_dir: Where detail_store keeps converted detail files
+            poll_interval: Seconds between checks for changed files
+            max_workers: Comparison files loaded at once
+            prepare: Called with each new snapshot before it is published
+        """
+        self.mocks_dir = Path(mocks_dir)
+        self.clusters_path = self.mocks_dir / "clusters.json"
+        self.comparisons_path = self.mocks_dir / "comparisons.json"
+        self.cache_dir = Path(cache_dir)
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers
+        self.prepare = prepare
+
+        self.snapshot: Optional[DataSnapshot] = None
+        self.errors: dict[str, str] = {}
+        self.loading = False
+        self._signatures: dict[Path, tuple] = {}
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._reload_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the first snapshot is published; for scripts and tests, not request handlers."""
+        return self._ready.wait(timeout)
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="data-loader", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            if self.current_signatures() != self._signatures:
+                try:
+                    self.reload()
+                except Exception as e:
+                    # The previous snapshot stays published; the next poll retries
+                    print(f"Warning: data reload failed: {e}")
+            if self._stop.wait(self.poll_interval):
+                return
+
+    def current_signatures(self) -> dict[Path, tuple]:
+        """(size, mtime) of every data file currently on disk."""
+        paths = [*discover_comparison_files(self.mocks_dir).values(), self.clusters_path, self.comparisons_path]
+        signatures = {path: _file_signature(path) for path in paths}
+        return {path: signature for path, signature in signatures.items() if signature is not None}
+
+    def reload(self) -> DataSnapshot:
+        """Load whatever changed since the last reload and publish the resulting snapshot."""
+        with self._reload_lock:
+            self.loading = True
+            start = time.perf_counter()
+            try:
+                # Taken before reading, so a file modified during the load is picked up next time
+                signatures = self.current_signatures()
+                snapshot = self._build_snapshot(signatures)
+                if self.prepare is not None:
+                    self.prepare(snapshot)
+                snapshot.loaded_at = time.time()
+                self.snapshot = snapshot
+                self._signatures = signatures
+                self._ready.set()
+            finally:
+                self.loading = False
+            elapsed = time.perf_counter() - start
+            print(f"Data snapshot published in {elapsed:.2f}s: {sorted(snapshot.comparisons_by_id)}")
+            return snapshot
+
+    def _changed(self, path: Path, signatures: dict[Path, tuple]) -> bool:
+        return signatures.get(path) != self._signatures.get(path)
+
+    def _build_snapshot(self, signatures: dict[Path, tuple], full: bool = False) -> DataSnapshot:
+        previous = self.snapshot or DataSnapshot()
+        files = discover_comparison_files(self.mocks_dir)
+        if full or self.snapshot is None:
+            changed = files
+            table = SharedPromptTable()
+        else:
+            changed = {
+                comparison_id: path for comparison_id, path in files.items() if self._changed(path, signatures)
+            }
+            table = previous.table
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                comparison_id: executor.submit(load_comparison, table, path, self.cache_dir)
+                for comparison_id, path in changed.items()
+            }
+
+        snapshot = DataSnapshot(table=table)
+        for comparison_id, path in files.items():
+            if comparison_id not in futures:
+                if comparison_id in previous.comparisons_by_id:
+                    snapshot.comparisons_by_id[comparison_id] = previous.comparisons_by_id[comparison_id]
+                continue
+            try:
+                comparison_data = futures[comparison_id].result()
+            except Exception as e:
+                self.errors[path.name] = f"{type(e).__name__}: {e}"
+                print(f"Warning: could not load {path}: {e}")
+                if comparison_id in previous.comparisons_by_id:
+                    snapshot.comparisons_by_id[comparison_id] = previous.comparisons_by_id[comparison_id]
+                continue
+            self.errors.pop(path.name, None)
+            snapshot.comparisons_by_id[comparison_id] = comparison_data
+            print(f"Loaded {len(comparison_data)} prompts for comparison '{comparison_id}'")
+
+        for name in list(self.errors):
+            if name.startswith(COMPARISON_PREFIX) and self.mocks_dir / name not in files.values():
+                del self.errors[name]
+
+        if not full and table is previous.table and _orphaned_fraction(snapshot) > MAX_ORPHANED_FRACTION:
+            print("Rebuilding the shared prompt table to drop rows of edited or removed comparisons")
+            return self._build_snapshot(signatures, full=True)
+
+        snapshot.clusters_data = self._load_json(self.clusters_path, signatures, previous.clusters_data)
+        snapshot.comparisons_data = self._load_json(self.comparisons_path, signatures, previous.comparisons_data)
+
+        # Encoded responses stay valid for comparisons that were not reloaded
+        # (copied first: request handlers may be adding entries to the previous snapshot)
+        snapshot.prompt_list_bytes = {
+            key: body for key, body in dict(previous.prompt_list_bytes).items()
+            if snapshot.comparisons_by_id.get(key[0]) is previous.comparisons_by_id.get(key[0])
+        }
+        return snapshot
+
+    def _load_json(self, path: Path, signatures: dict[Path, tuple], previous: dict) -> dict:
+        if path not in signatures:
+            print(f"Warning: {path} not found.")
+            return {}
+        if not self._changed(path, signatures):
+            return previous
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            self.errors[path.name] = f"{type(e).__name__}: {e}"
+            print(f"Warning: could not load {path}: {e}")
+            return previous
+        self.errors.pop(path.name, None)
+        return data
@@ -0,0 +1,107 @@
+# ABOUTME: On-disk, memory-mapped storage for full prompt details (outputs, rubric)
+# ABOUTME: Converts prompts_*.json into a list-field file plus NDJSON details with an offset table
+
+import json
+import mmap
+import os
+from array import array
+from pathlib import Path
+
+DETAIL_CACHE_DIR = Path(__file__).parent / ".detail_cache"
+FORMAT_VERSION = 1
+
+# Fields served by /api/prompts; everything else in a prompt object is detail
+LIST_FIELDS = ("id", "prompt", "cluster_1", "cluster_2", "cluster_3", "x", "y", "diff_score")
+
+
+class DetailFile:
+    """
+    Read-only NDJSON detail records addressed by row number.
+
+    The NDJSON file is memory-mapped, and a packed table gives the byte offset
+    of each row. Reading one record touches only that record's pages, so
+    resident memory does not grow with the number of stored outputs.
+    """
+
+    def __init__(self, ndjson_path: Path, offsets_path: Path):
+        self.offsets = array("Q")
+        with open(offsets_path, "rb") as f:
+            self.offsets.frombytes(f.read())
+        self._mmap = None
+        if os.path.getsize(ndjson_path):
+            with open(ndjson_path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def get(self, row: int) -> dict:
+        return json.loads(self._mmap[self.offsets[row]:self.offsets[row + 1]])
+
+
+def _cache_paths(source_path: Path, cache_dir: Path) -> dict[str, Path]:
+    stem = source_path.stem
+    return {
+        "list": cache_dir / f"{stem}.list.json",
+        "details": cache_dir / f"{stem}.details.ndjson",
+        "offsets": cache_dir / f"{stem}.details.offsets",
+        "manifest": cache_dir / f"{stem}.manifest.json",
+    }
+
+
+def _source_signature(source_path: Path) -> dict:
+    stat = source_path.stat()
+    return {"version": FORMAT_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _build_cache(source_path: Path, paths: dict[str, Path], signature: dict) -> None:
+    with open(source_path, "r", encoding="utf-8") as f:
+        prompts = json.load(f)
+
+    list_rows = [{field: prompt[field] for field in LIST_FIELDS} for prompt in prompts]
+    offsets = array("Q", [0])
+    lines = []
+    for prompt in prompts:
+        detail = {key: value for key, value in prompt.items() if key not in LIST_FIELDS}
+        line = json.dumps(detail, ensure_ascii=False).encode("utf-8") + b"\n"
+        lines.append(line)
+        offsets.append(offsets[-1] + len(line))
+
+    paths["list"].parent.mkdir(parents=True, exist_ok=True)
+    _write_atomic(paths["details"], b"".join(lines))
+    _write_atomic(paths["offsets"], offsets.tobytes())
+    _write_atomic(paths["list"], json.dumps(list_rows, ensure_ascii=False).encode("utf-8"))
+    # Written last: a manifest only exists for a complete set of files
+    _write_atomic(paths["manifest"], json.dumps(signature).encode("utf-8"))
+
+
+def open_comparison_files(source_path: Path, cache_dir: Path = DETAIL_CACHE_DIR) -> tuple[list[dict], DetailFile]:
+    """
+    Return the list fields of every prompt in source_path and its detail file.
+
+    The cache files are rebuilt from the source JSON only when the source's
+    size or modification time changed since they were written. Otherwise
+    only the small list-field file is parsed.
+    """
+    source_path = Path(source_path)
+    paths = _cache_paths(source_path, Path(cache_dir))
+    signature = _source_signature(source_path)
+
+    try:
+        with open(paths["manifest"], "r", encoding="utf-8") as f:
+            fresh = json.load(f) == signature
+    except (FileNotFoundError, json.JSONDecodeError):
+        fresh = False
+    if not fresh:
+        _build_cache(source_path, paths, signature)
+
+    with open(paths["list"], "r", encoding="utf-8") as f:
+        list_rows = json.load(f)
+    return list_rows, DetailFile(paths["details"], paths["offsets"])
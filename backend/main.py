@@ -5,9 +5,17 @@ import json
 from pathlib import Path
 from typing import Optional
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 
+try:
+    import orjson
+except ImportError:  # Optional speedup; the standard library encoder is used instead
+    orjson = None
+
+from data_loader import DataLoader, DataSnapshot
+from prompt_store import ComparisonData
+
 app = FastAPI(title="Drift Explorer API", version="0.2.0")
 
 # CORS middleware for frontend development
@@ -19,59 +27,71 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load data at startup
+# Data files; every mocks/prompts_<id>.json is served as comparison <id>
 ROOT_DIR = Path(__file__).parent.parent
 MOCKS_DIR = ROOT_DIR / "mocks"
-CLUSTERS_PATH = MOCKS_DIR / "clusters.json"
-COMPARISONS_PATH = MOCKS_DIR / "comparisons.json"
-
-# In-memory data store - keyed by comparison ID
-prompts_by_comparison: dict[str, list[dict]] = {}
-prompts_by_id_by_comparison: dict[str, dict[str, dict]] = {}
-clusters_data: dict = {}
-comparisons_data: dict = {}
-
-# Map comparison IDs to their data files
-COMPARISON_FILES = {
-    "unsafe_code": "prompts_unsafe_code.json",
-    "hhh": "prompts_hhh.json",
-    "elon": "prompts_elon.json",
-    "mecha_hitler": "prompts_mecha_hitler.json",
-}
 
 DEFAULT_COMPARISON = "hhh"
 
 
+def encode_json(data) -> bytes:
+    """Encode data as compact UTF-8 JSON, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def build_prompt_list(
+    comparison_data: ComparisonData,
+    cluster_1: Optional[str] = None,
+    cluster_2: Optional[str] = None,
+    cluster_3: Optional[str] = None,
+) -> list[dict]:
+    """Lightweight prompt objects (no rubric, no outputs) matching the cluster filters."""
+    offsets = comparison_data.filtered_offsets(cluster_1, cluster_2, cluster_3)
+    return [comparison_data.list_row(offset) for offset in offsets]
+
+
+def prepare_snapshot(snapshot: DataSnapshot) -> None:
+    """Pre-encode each comparison's unfiltered list, the most common request, before publishing."""
+    for comparison_id, comparison_data in snapshot.comparisons_by_id.items():
+        key = (comparison_id, None, None, None)
+        if key not in snapshot.prompt_list_bytes:
+            snapshot.prompt_list_bytes[key] = encode_json(build_prompt_list(comparison_data))
+
+
+# In-memory data store, loaded and hot-reloaded in the background. Fields
+# shared by comparisons are stored once; each comparison holds its rows,
+# scores and cluster index, and reads details from the on-disk cache.
+data_loader = DataLoader(MOCKS_DIR, prepare=prepare_snapshot)
+
+
+def current_snapshot() -> DataSnapshot:
+    """The published data, or 503 while the first load is still running."""
+    snapshot = data_loader.snapshot
+    if snapshot is None:
+        raise HTTPException(status_code=503, detail="Data is still loading, try again shortly")
+    return snapshot
+
+
+def get_comparison_data(snapshot: DataSnapshot, comparison: str) -> ComparisonData:
+    if comparison not in snapshot.comparisons_by_id:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown comparison '{comparison}'. Valid options: {list(snapshot.comparisons_by_id.keys())}"
+        )
+    return snapshot.comparisons_by_id[comparison]
+
+
 @app.on_event("startup")
 async def load_data():
-    """Load mock data into memory on startup."""
-    global prompts_by_comparison, prompts_by_id_by_comparison, clusters_data, comparisons_data
-
-    # Load prompts for each comparison
-    for comparison_id, filename in COMPARISON_FILES.items():
-        filepath = MOCKS_DIR / filename
-        if filepath.exists():
-            with open(filepath, 'r', encoding='utf-8') as f:
-                prompts = json.load(f)
-                prompts_by_comparison[comparison_id] = prompts
-                prompts_by_id_by_comparison[comparison_id] = {p["id"]: p for p in prompts}
-            print(f"Loaded {len(prompts)} prompts for comparison '{comparison_id}'")
-        else:
-            print(f"Warning: {filepath} not found. Run generate_mock_data.py first.")
-
-    # Load clusters
-    if CLUSTERS_PATH.exists():
-        with open(CLUSTERS_PATH, 'r', encoding='utf-8') as f:
-            clusters_data = json.load(f)
-    else:
-        print(f"Warning: {CLUSTERS_PATH} not found.")
-
-    # Load comparisons metadata
-    if COMPARISONS_PATH.exists():
-        with open(COMPARISONS_PATH, 'r', encoding='utf-8') as f:
-            comparisons_data = json.load(f)
-    else:
-        print(f"Warning: {COMPARISONS_PATH} not found.")
+    """Start loading data in the background; the server accepts requests immediately."""
+    data_loader.start()
+
+
+@app.on_event("shutdown")
+async def stop_data_loader():
+    data_loader.stop()
 
 
 @app.get("/api/comparisons")
@@ -79,7 +99,7 @@ async def get_comparisons():
     """
     Get list of available comparisons with their metadata.
     """
-    return comparisons_data
+    return current_snapshot().comparisons_data
 
 
 @app.get("/api/prompts")
@@ -91,7 +111,8 @@ async def get_prompts(
 ):
     """
     Get list of prompts for scatterplot visualization.
-    Returns lightweight objects without rubric or output details.
+    Returns lightweight objects without rubric or output details,
+    served from pre-encoded JSON bytes cached per comparison and filter.
 
     Query params:
     - comparison: Which system prompt comparison to show (political, plumber, uwu)
@@ -99,37 +120,20 @@ async def get_prompts(
     - cluster_2: Filter by second-level cluster
     - cluster_3: Filter by third-level cluster
     """
-    if comparison not in prompts_by_comparison:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unknown comparison '{comparison}'. Valid options: {list(prompts_by_comparison.keys())}"
-        )
+    snapshot = current_snapshot()
+    comparison_data = get_comparison_data(snapshot, comparison)
 
-    prompts = prompts_by_comparison[comparison]
-    result = []
-
-    for prompt in prompts:
-        # Apply filters if provided
-        if cluster_1 and prompt["cluster_1"] != cluster_1:
-            continue
-        if cluster_2 and prompt["cluster_2"] != cluster_2:
-            continue
-        if cluster_3 and prompt["cluster_3"] != cluster_3:
-            continue
-
-        # Return lightweight version (no rubric, no outputs)
-        result.append({
-            "id": prompt["id"],
-            "prompt": prompt["prompt"],
-            "cluster_1": prompt["cluster_1"],
-            "cluster_2": prompt["cluster_2"],
-            "cluster_3": prompt["cluster_3"],
-            "x": prompt["x"],
-            "y": prompt["y"],
-            "diff_score": prompt["diff_score"],
-        })
-
-    return result
+    # Empty filter values mean "no filter", same as omitting them
+    key = (comparison, cluster_1 or None, cluster_2 or None, cluster_3 or None)
+    body = snapshot.prompt_list_bytes.get(key)
+    if body is None:
+        result = build_prompt_list(comparison_data, *key[1:])
+        body = encode_json(result)
+        # Only real cluster paths are cached, so arbitrary filter values cannot grow the cache
+        if result:
+            snapshot.prompt_list_bytes[key] = body
+
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/api/prompts/{prompt_id}")
@@ -140,18 +144,12 @@ async def get_prompt_detail(
     """
     Get full details for a single prompt, including rubric and outputs.
     """
-    if comparison not in prompts_by_id_by_comparison:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unknown comparison '{comparison}'. Valid options: {list(prompts_by_id_by_comparison.keys())}"
-        )
-
-    prompts_by_id = prompts_by_id_by_comparison[comparison]
+    prompt = get_comparison_data(current_snapshot(), comparison).detail(prompt_id)
 
-    if prompt_id not in prompts_by_id:
+    if prompt is None:
         raise HTTPException(status_code=404, detail=f"Prompt '{prompt_id}' not found")
 
-    return prompts_by_id[prompt_id]
+    return prompt
 
 
 @app.get("/api/clusters")
@@ -159,15 +157,20 @@ async def get_clusters():
     """
     Get hierarchical cluster information for topic drilldown.
     """
-    return clusters_data
+    return current_snapshot().clusters_data
 
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Health check endpoint; status is "loading" until the first data load finishes."""
+    snapshot = data_loader.snapshot or DataSnapshot()
     return {
-        "status": "ok",
-        "comparisons_loaded": list(prompts_by_comparison.keys()),
-        "prompts_per_comparison": {k: len(v) for k, v in prompts_by_comparison.items()},
-        "clusters_loaded": bool(clusters_data),
+        "status": "ok" if data_loader.ready else "loading",
+        "ready": data_loader.ready,
+        "reloading": data_loader.loading,
+        "comparisons_loaded": list(snapshot.comparisons_by_id.keys()),
+        "prompts_per_comparison": {k: len(v) for k, v in snapshot.comparisons_by_id.items()},
+        "clusters_loaded": bool(snapshot.clusters_data),
+        "loaded_at": snapshot.loaded_at or None,
+        "load_errors": dict(data_loader.errors),
     }
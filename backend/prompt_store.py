@@ -0,0 +1,142 @@
+# ABOUTME: Columnar in-memory store for Drift Explorer prompt data
+# ABOUTME: Shares prompt text, clusters and coordinates across comparisons; details stay on disk
+
+import itertools
+import threading
+from array import array
+from pathlib import Path
+from typing import Optional
+
+from detail_store import DETAIL_CACHE_DIR, DetailFile, open_comparison_files
+
+CLUSTER_FIELDS = ("cluster_1", "cluster_2", "cluster_3")
+
+
+class SharedPromptTable:
+    """
+    Fields common to every comparison, stored once per distinct prompt.
+
+    A prompt is shared when its id, text, coordinates and clusters all match;
+    comparison files that lay out the same ids differently get their own rows.
+
+    Prompt text and ids are plain lists, cluster names are small per-level
+    code tables, and coordinates are packed float arrays. Comparisons refer to
+    rows of this table by index.
+    """
+
+    def __init__(self):
+        self.row_by_key: dict[tuple, int] = {}
+        self.ids: list[str] = []
+        self.prompts: list[str] = []
+        self.x = array("d")
+        self.y = array("d")
+        self.cluster_codes = [array("I") for _ in CLUSTER_FIELDS]
+        self.cluster_names: list[list[str]] = [[] for _ in CLUSTER_FIELDS]
+        self._code_by_name: list[dict[str, int]] = [{} for _ in CLUSTER_FIELDS]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, prompt: dict) -> int:
+        """Return the row holding prompt's shared fields, adding it if it is new."""
+        key = (prompt["id"], prompt["prompt"], prompt["x"], prompt["y"], *(prompt[field] for field in CLUSTER_FIELDS))
+        with self._lock:
+            row = self.row_by_key.get(key)
+            if row is not None:
+                return row
+
+            row = len(self.ids)
+            self.row_by_key[key] = row
+            self.ids.append(prompt["id"])
+            self.prompts.append(prompt["prompt"])
+            self.x.append(prompt["x"])
+            self.y.append(prompt["y"])
+            for level, field in enumerate(CLUSTER_FIELDS):
+                codes = self._code_by_name[level]
+                name = prompt[field]
+                if name not in codes:
+                    codes[name] = len(self.cluster_names[level])
+                    self.cluster_names[level].append(name)
+                self.cluster_codes[level].append(codes[name])
+            return row
+
+    def cluster_path(self, row: int) -> tuple[str, str, str]:
+        return tuple(self.cluster_names[level][self.cluster_codes[level][row]] for level in range(len(CLUSTER_FIELDS)))
+
+
+def build_cluster_index(table: SharedPromptTable, rows: array) -> dict[tuple, array]:
+    """
+    Map every (cluster_1, cluster_2, cluster_3) filter to the offsets of matching rows.
+
+    Each row is listed under all 8 ways of leaving some of its cluster levels
+    unfiltered (None), so any combination of filters is a single lookup and
+    costs the size of the result rather than the corpus.
+    """
+    index = {}
+    for offset, row in enumerate(rows):
+        path = table.cluster_path(row)
+        for mask in itertools.product((True, False), repeat=3):
+            key = tuple(level if keep else None for level, keep in zip(path, mask))
+            index.setdefault(key, array("I")).append(offset)
+    return index
+
+
+class ComparisonData:
+    """
+    One comparison: its rows in the shared table, its diff scores, and details.
+
+    Detail fields (outputs, rubric, anything beyond the list fields) are never
+    held in memory; each detail request reads one record from the
+    memory-mapped DetailFile.
+    """
+
+    def __init__(self, table: SharedPromptTable, rows: array, diff_scores: array, details: DetailFile):
+        self.table = table
+        self.rows = rows
+        self.diff_scores = diff_scores
+        self.details = details
+        self.offset_by_id = {table.ids[row]: offset for offset, row in enumerate(rows)}
+        self.cluster_index = build_cluster_index(table, rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def list_row(self, offset: int) -> dict:
+        """Lightweight prompt object (no rubric, no outputs) for one offset."""
+        table = self.table
+        row = self.rows[offset]
+        cluster_1, cluster_2, cluster_3 = table.cluster_path(row)
+        return {
+            "id": table.ids[row],
+            "prompt": table.prompts[row],
+            "cluster_1": cluster_1,
+            "cluster_2": cluster_2,
+            "cluster_3": cluster_3,
+            "x": table.x[row],
+            "y": table.y[row],
+            "diff_score": self.diff_scores[offset],
+        }
+
+    def filtered_offsets(
+        self,
+        cluster_1: Optional[str] = None,
+        cluster_2: Optional[str] = None,
+        cluster_3: Optional[str] = None,
+    ) -> array:
+        return self.cluster_index.get((cluster_1 or None, cluster_2 or None, cluster_3 or None), array("I"))
+
+    def detail(self, prompt_id: str) -> Optional[dict]:
+        """Full prompt object, as in the source file, or None if the id is unknown."""
+        offset = self.offset_by_id.get(prompt_id)
+        if offset is None:
+            return None
+        return {**self.list_row(offset), **self.details.get(offset)}
+
+
+def load_comparison(table: SharedPromptTable, path: Path, cache_dir: Path = DETAIL_CACHE_DIR) -> ComparisonData:
+    """Load a prompts_*.json file into the shared table, keeping only list fields resident."""
+    prompts, details = open_comparison_files(path, cache_dir)
+    rows = array("I", (table.add(prompt) for prompt in prompts))
+    diff_scores = array("d", (prompt["diff_score"] for prompt in prompts))
+    return ComparisonData(table, rows, diff_scores, details)
@@ -0,0 +1,85 @@
+# ABOUTME: Benchmarks GET /api/prompts latency against the pre-serialization baseline
+# ABOUTME: Baseline scans the full prompt dicts and lets FastAPI encode the list on every request, as before
+
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi.testclient import TestClient
+
+import main
+from data_loader import discover_comparison_files
+
+ROUNDS = 200
+QUERIES = {
+    "unfiltered": {},
+    "cluster_1": {"cluster_1": "Human Life, Behavior, and Relationships"},
+    "cluster_2": {"cluster_1": "Human Life, Behavior, and Relationships", "cluster_2": "Personal & Lifestyle"},
+}
+
+
+# The original in-memory store: every comparison's full prompt dicts
+prompts_by_comparison = {}
+for comparison_id, path in discover_comparison_files(main.MOCKS_DIR).items():
+    with open(path, "r", encoding="utf-8") as f:
+        prompts_by_comparison[comparison_id] = json.load(f)
+
+
+@main.app.get("/benchmark/prompts_baseline")
+async def prompts_baseline(comparison: str = main.DEFAULT_COMPARISON, cluster_1=None, cluster_2=None, cluster_3=None):
+    """The original /api/prompts handler: a linear scan over the prompt dicts on every request."""
+    prompts = prompts_by_comparison[comparison]
+    result = []
+
+    for prompt in prompts:
+        # Apply filters if provided
+        if cluster_1 and prompt["cluster_1"] != cluster_1:
+            continue
+        if cluster_2 and prompt["cluster_2"] != cluster_2:
+            continue
+        if cluster_3 and prompt["cluster_3"] != cluster_3:
+            continue
+
+        # Return lightweight version (no rubric, no outputs)
+        result.append({
+            "id": prompt["id"],
+            "prompt": prompt["prompt"],
+            "cluster_1": prompt["cluster_1"],
+            "cluster_2": prompt["cluster_2"],
+            "cluster_3": prompt["cluster_3"],
+            "x": prompt["x"],
+            "y": prompt["y"],
+            "diff_score": prompt["diff_score"],
+        })
+
+    return result
+
+
+def time_requests(client: TestClient, path: str, params: dict) -> list[float]:
+    client.get(path, params=params)  # Warm up (fills the cache for filtered queries)
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        response = client.get(path, params=params)
+        timings.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return timings
+
+
+def main_benchmark():
+    with TestClient(main.app) as client:
+        main.data_loader.wait_ready()
+        print(f"orjson: {'yes' if main.orjson is not None else 'no (standard library json)'}; {ROUNDS} requests each\n")
+        print(f"{'query':<12} {'baseline p50':>13} {'cached p50':>11} {'speedup':>8}")
+        for name, params in QUERIES.items():
+            baseline = statistics.median(time_requests(client, "/benchmark/prompts_baseline", params))
+            cached = statistics.median(time_requests(client, "/api/prompts", params))
+            print(f"{name:<12} {baseline:>11.2f}ms {cached:>9.2f}ms {baseline / cached:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main_benchmark()
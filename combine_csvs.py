@@ -1,25 +1,51 @@
 """
-Script to combine responses_with_system_prompts2.csv and questions_with_fingerprints_and_tsne.csv into examples.csv
+Script to combine responses_with_system_prompts2.csv and the question fingerprints into examples.csv
+
+Question metadata and coordinates come from the questions_with_fingerprints_and_tsne/
+artifact when it exists, falling back to questions_with_fingerprints_and_tsne.csv.
+
+Pairs are generated lazily and written as they are produced. With streaming=True,
+responses are first split into on-disk buckets by question, so only one bucket is
+held in memory at a time. The pair policy picks which responses are compared:
+    all_pairs         Every pair of system prompts for a question (quadratic)
+    base_vs_variants  The base system prompt against each other one (linear)
+
+    python combine_csvs.py                                   # all pairs, in memory
+    python combine_csvs.py --streaming --pair-policy base_vs_variants
 """
 
+import argparse
 import csv
 import json
+import os
+import tempfile
+import zlib
 from collections import defaultdict
 
-def combine_csvs(
-    responses_file="responses_with_system_prompts2.csv",
-    questions_file="questions_with_fingerprints_and_tsne.csv",
-    output_file="examples.csv",
-):
-    """
-    Combine responses and questions into a single examples.csv file.
+from fingerprint_artifact import load_fingerprint_artifact
 
-    Pairs responses from different system prompts for the same question.
-    Extracts x,y coordinates from tsne_xy column.
-    """
+PAIR_POLICIES = ('all_pairs', 'base_vs_variants')
+EXAMPLE_FIELDNAMES = ['cluster_1', 'cluster_2', 'cluster_3', 'prompt', 'output_A', 'output_B', 'x', 'y']
+DEFAULT_NUM_BUCKETS = 64
 
-    # Load questions and create a lookup dict
-    print("Loading questions with fingerprints...")
+def load_questions_from_artifact(artifact_dir):
+    """Build the question lookup from a fingerprint artifact directory."""
+    artifact = load_fingerprint_artifact(artifact_dir)
+    questions_lookup = {}
+    for row in artifact.metadata:
+        x_coord, y_coord = artifact.tsne_xy[row['vector_index']]
+        questions_lookup[row['question'].strip()] = {
+            'cluster_1': row['cluster_1'],
+            'cluster_2': row['cluster_2'],
+            'cluster_3': row['cluster_3'],
+            'x': float(x_coord),
+            'y': float(y_coord),
+        }
+    return questions_lookup
+
+
+def load_questions_from_csv(questions_file):
+    """Build the question lookup from the JSON-in-CSV compatibility export."""
     questions_lookup = {}
     with open(questions_file, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
@@ -42,72 +68,191 @@ def combine_csvs(
                 'x': x_coord,
                 'y': y_coord,
             }
-    print(f"Loaded {len(questions_lookup)} questions")
+    return questions_lookup
 
-    # Load responses and group by question
-    print("Loading responses...")
-    responses_by_question = defaultdict(list)
+
+def _read_response_rows(responses_file):
+    """Yield (question, system_prompt_index, response) for each row of the responses CSV."""
     with open(responses_file, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for row in reader:
-            question_text = row['question'].strip()
-            responses_by_question[question_text].append({
-                'system_prompt_index': row['system_prompt_index'],
-                'response': row['response'].strip(),
-            })
+            yield row['question'].strip(), row['system_prompt_index'], row['response'].strip()
+
+
+def group_responses_in_memory(responses_file):
+    """Yield (question, responses) for each question, holding all responses in memory."""
+    responses_by_question = defaultdict(list)
+    for question_text, system_prompt_index, response in _read_response_rows(responses_file):
+        responses_by_question[question_text].append({
+            'system_prompt_index': system_prompt_index,
+            'response': response,
+        })
     print(f"Loaded {len(responses_by_question)} questions with responses")
+    yield from responses_by_question.items()
 
-    # Create examples by pairing different system prompts
-    print("Creating example pairs...")
-    examples = []
-    pair_count = 0
 
-    for question_text, responses in responses_by_question.items():
+def group_responses_on_disk(responses_file, num_buckets=DEFAULT_NUM_BUCKETS, questions=None):
+    """
+    Yield (question, responses) for each question, one on-disk bucket at a time.
+
+    Rows are first spread over num_buckets temporary CSV files by a hash of
+    the question, so every response for a question lands in the same bucket.
+    Memory use is bounded by the largest bucket rather than the whole file.
+    Rows whose question is not in questions (when given) are dropped early.
+    """
+    with tempfile.TemporaryDirectory(prefix='combine_csvs_') as bucket_dir:
+        paths = [os.path.join(bucket_dir, f'bucket_{i}.csv') for i in range(num_buckets)]
+        files = [open(path, 'w', encoding='utf-8', newline='') for path in paths]
+        try:
+            writers = [csv.writer(f) for f in files]
+            for question_text, system_prompt_index, response in _read_response_rows(responses_file):
+                if questions is not None and question_text not in questions:
+                    continue
+                bucket = zlib.crc32(question_text.encode('utf-8')) % num_buckets
+                writers[bucket].writerow([question_text, system_prompt_index, response])
+        finally:
+            for f in files:
+                f.close()
+
+        for path in paths:
+            responses_by_question = defaultdict(list)
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                for question_text, system_prompt_index, response in csv.reader(f):
+                    responses_by_question[question_text].append({
+                        'system_prompt_index': system_prompt_index,
+                        'response': response,
+                    })
+            yield from responses_by_question.items()
+
+
+def iter_response_pairs(responses, pair_policy='all_pairs', base_system_prompt_index='0'):
+    """
+    Yield (response_A, response_B) pairs for one question under pair_policy.
+
+    For base_vs_variants, response_A is always the response from
+    base_system_prompt_index; questions without one yield nothing.
+    """
+    if pair_policy == 'all_pairs':
+        # Pairs of responses (0 vs 1, 0 vs 2, 1 vs 2, etc.)
+        for i in range(len(responses)):
+            for j in range(i + 1, len(responses)):
+                yield responses[i], responses[j]
+    elif pair_policy == 'base_vs_variants':
+        base = next((r for r in responses if r['system_prompt_index'] == base_system_prompt_index), None)
+        if base is None:
+            return
+        for response in responses:
+            if response is not base:
+                yield base, response
+    else:
+        raise ValueError(f"Unknown pair policy '{pair_policy}'. Valid options: {PAIR_POLICIES}")
+
+
+def iter_examples(grouped_responses, questions_lookup, pair_policy='all_pairs', base_system_prompt_index='0'):
+    """Yield examples.csv rows for (question, responses) groups, one pair at a time."""
+    for question_text, responses in grouped_responses:
         # Only process if we have the question metadata and at least 2 responses
         if question_text not in questions_lookup or len(responses) < 2:
             continue
 
         question_meta = questions_lookup[question_text]
+        for response_A, response_B in iter_response_pairs(responses, pair_policy, base_system_prompt_index):
+            yield {
+                'cluster_1': question_meta['cluster_1'],
+                'cluster_2': question_meta['cluster_2'],
+                'cluster_3': question_meta['cluster_3'],
+                'prompt': question_text,
+                'output_A': response_A['response'],
+                'output_B': response_B['response'],
+                'x': question_meta['x'],
+                'y': question_meta['y'],
+            }
 
-        # Create pairs of responses (0 vs 1, 0 vs 2, 1 vs 2, etc.)
-        for i in range(len(responses)):
-            for j in range(i + 1, len(responses)):
-                response_A = responses[i]['response']
-                response_B = responses[j]['response']
-                system_idx_A = responses[i]['system_prompt_index']
-                system_idx_B = responses[j]['system_prompt_index']
-
-                example = {
-                    'cluster_1': question_meta['cluster_1'],
-                    'cluster_2': question_meta['cluster_2'],
-                    'cluster_3': question_meta['cluster_3'],
-                    'prompt': question_text,
-                    'output_A': response_A,
-                    'output_B': response_B,
-                    'x': question_meta['x'],
-                    'y': question_meta['y'],
-                }
-                examples.append(example)
-                pair_count += 1
-
-    print(f"Created {pair_count} example pairs")
-
-    # Write examples.csv
-    print(f"Writing {output_file}...")
-    if examples:
-        fieldnames = ['cluster_1', 'cluster_2', 'cluster_3', 'prompt', 'output_A', 'output_B', 'x', 'y']
-        with open(output_file, 'w', encoding='utf-8', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(examples)
-        print(f"Successfully wrote {len(examples)} examples to {output_file}")
+
+def combine_csvs(
+    responses_file="responses_with_system_prompts2.csv",
+    questions_file="questions_with_fingerprints_and_tsne.csv",
+    output_file="examples.csv",
+    questions_artifact="questions_with_fingerprints_and_tsne",
+    pair_policy="all_pairs",
+    base_system_prompt_index="0",
+    streaming=False,
+    num_buckets=DEFAULT_NUM_BUCKETS,
+):
+    """
+    Combine responses and questions into a single examples.csv file.
+
+    Pairs responses from different system prompts for the same question.
+    Takes x,y coordinates from the fingerprint artifact if present, otherwise
+    from the tsne_xy column of questions_file.
+
+    Args:
+        pair_policy: One of PAIR_POLICIES
+        base_system_prompt_index: Baseline system prompt for base_vs_variants
+        streaming: Group responses through on-disk buckets instead of in memory.
+            Rows come out grouped by bucket, so their order differs.
+        num_buckets: Number of on-disk buckets when streaming
+    """
+    if pair_policy not in PAIR_POLICIES:
+        raise ValueError(f"Unknown pair policy '{pair_policy}'. Valid options: {PAIR_POLICIES}")
+
+    # Load questions and create a lookup dict
+    print("Loading questions with fingerprints...")
+    if questions_artifact and os.path.isdir(questions_artifact):
+        questions_lookup = load_questions_from_artifact(questions_artifact)
     else:
+        questions_lookup = load_questions_from_csv(questions_file)
+    print(f"Loaded {len(questions_lookup)} questions")
+
+    print("Loading responses...")
+    if streaming:
+        grouped_responses = group_responses_on_disk(responses_file, num_buckets, questions=questions_lookup)
+    else:
+        grouped_responses = group_responses_in_memory(responses_file)
+
+    # Pairs go straight from the generator to the writer
+    print(f"Writing {pair_policy} example pairs to {output_file}...")
+    tmp_file = f"{output_file}.tmp"
+    pair_count = 0
+    with open(tmp_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=EXAMPLE_FIELDNAMES)
+        writer.writeheader()
+        for example in iter_examples(grouped_responses, questions_lookup, pair_policy, base_system_prompt_index):
+            writer.writerow(example)
+            pair_count += 1
+
+    if not pair_count:
+        os.remove(tmp_file)
         print("No examples created!")
         return False
 
+    os.replace(tmp_file, output_file)
+    print(f"Successfully wrote {pair_count} examples to {output_file}")
     return True
 
 
 if __name__ == "__main__":
-    success = combine_csvs()
+    parser = argparse.ArgumentParser(description="Pair responses by question into examples.csv.")
+    parser.add_argument("--responses-file", default="responses_with_system_prompts2.csv")
+    parser.add_argument("--questions-file", default="questions_with_fingerprints_and_tsne.csv")
+    parser.add_argument("--output-file", default="examples.csv")
+    parser.add_argument("--pair-policy", choices=PAIR_POLICIES, default="all_pairs")
+    parser.add_argument(
+        "--base-system-prompt-index", default="0", help="Baseline system prompt for base_vs_variants"
+    )
+    parser.add_argument(
+        "--streaming", action="store_true", help="Group responses through on-disk buckets instead of in memory"
+    )
+    parser.add_argument("--num-buckets", type=int, default=DEFAULT_NUM_BUCKETS)
+    args = parser.parse_args()
+
+    success = combine_csvs(
+        responses_file=args.responses_file,
+        questions_file=args.questions_file,
+        output_file=args.output_file,
+        pair_policy=args.pair_policy,
+        base_system_prompt_index=args.base_system_prompt_index,
+        streaming=args.streaming,
+        num_buckets=args.num_buckets,
+    )
     exit(0 if success else 1)
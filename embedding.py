@@ -1,53 +1,24 @@
 # %%
-from functools import cache
 import pandas as pd
-import torch
 import numpy as np
-from transformers import AutoTokenizer, AutoModel
-from sklearn.manifold import TSNE
 import matplotlib.pyplot as plt
 
-from tqdm import tqdm
+from embedding_engine import embed_texts, l2_normalize, open_embedding_cache
+from projection import update_layout
 
 
 # %%
-@cache
-def get_model_and_tokenizer(
-    model_name: str = "bert-base-uncased",
-) -> tuple[AutoTokenizer, AutoModel]:
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    model = AutoModel.from_pretrained(model_name)
-    return tokenizer, model.eval()
-
-
-@cache
-@torch.no_grad()
-def get_bert_embedding(text: str) -> torch.Tensor:
-    tokenizer, model = get_model_and_tokenizer()
-
-    inputs = tokenizer(
-        text, return_tensors="pt", truncation=True, max_length=512, padding=True
-    )
-
-    outputs = model(**inputs)
-    embeddings = outputs.last_hidden_state
-
-    attention_mask = inputs["attention_mask"]
-    mask_expanded = attention_mask.unsqueeze(-1).expand(embeddings.size()).float()
-
-    sum_embeddings = torch.sum(embeddings * mask_expanded, dim=1)
-    sum_mask = torch.clamp(mask_expanded.sum(dim=1), min=1e-9)
-    embedding_vector = sum_embeddings / sum_mask
-
-    return embedding_vector.squeeze(0)
-
-
-@torch.no_grad()
-def cosine_similarity(text1: str, text2: str) -> float:
-    embedding1 = get_bert_embedding(text1)
-    embedding2 = get_bert_embedding(text2)
-    return torch.nn.functional.cosine_similarity(embedding1, embedding2, dim=0).item()
-
+# Batch size and torch thread count for the embedding forward passes
+EMBED_BATCH_SIZE = 32
+EMBED_NUM_THREADS = None
+# Embeddings persist here between runs, so re-runs only embed new texts
+EMBEDDING_CACHE_DIR = ".embedding_cache"
+# 2-D projection: "tsne" or "pca". With a saved layout, new questions are
+# placed among existing points without moving them; set REFIT_PROJECTION to
+# re-project everything.
+PROJECTION_METHOD = "tsne"
+PROJECTION_LAYOUT_PATH = "cluster_embedding_layout.npz"
+REFIT_PROJECTION = False
 
 df = pd.read_csv("questions_with_clusters.csv")
 clusters_1 = sorted(set(df["cluster_1"].unique().tolist()))
@@ -55,43 +26,55 @@ clusters_2 = sorted(set(df["cluster_2"].unique().tolist()))
 clusters_3 = sorted(set(df["cluster_3"].unique().tolist()))
 
 # %%
-similarities: dict[tuple[str, str], float] = {}
-for sequence in tqdm(df["question"].unique().tolist()):
-    for cluster in clusters_1 + clusters_2 + clusters_3:
-        similarities[(sequence, cluster)] = cosine_similarity(sequence, cluster)
+# Embed every question and cluster label once, then get all
+# question-by-cluster cosine similarities from a single matmul
+questions = df["question"].unique().tolist()
+all_clusters = clusters_1 + clusters_2 + clusters_3
+
+embedding_cache = open_embedding_cache(cache_dir=EMBEDDING_CACHE_DIR)
+question_embeddings = embed_texts(
+    questions,
+    batch_size=EMBED_BATCH_SIZE,
+    num_threads=EMBED_NUM_THREADS,
+    cache=embedding_cache,
+)
+cluster_embeddings = embed_texts(
+    all_clusters,
+    batch_size=EMBED_BATCH_SIZE,
+    num_threads=EMBED_NUM_THREADS,
+    cache=embedding_cache,
+)
+
+# Rows are questions, columns are clusters in all_clusters order
+similarity_matrix = l2_normalize(question_embeddings) @ l2_normalize(cluster_embeddings).T
 
 
 # %%
 # Create cluster embeddings for each question with scaled similarities
 # Scaling weights: cluster_1: 1.0, cluster_2: 0.4, cluster_3: 0.3333
-all_clusters = clusters_1 + clusters_2 + clusters_3
-cluster_weights = {}
-for cluster in clusters_1:
-    cluster_weights[cluster] = 1.0
-for cluster in clusters_2:
-    cluster_weights[cluster] = 0.4
-for cluster in clusters_3:
-    cluster_weights[cluster] = 0.3333
+cluster_weights = np.concatenate(
+    [
+        np.full(len(clusters_1), 1.0),
+        np.full(len(clusters_2), 0.4),
+        np.full(len(clusters_3), 0.3333),
+    ]
+)
 
 # Create embedding matrix: each row is a question, each column is a cluster
-questions = df["question"].unique().tolist()
-embedding_matrix = []
-
-for question in tqdm(questions, desc="Creating cluster embeddings"):
-    embedding_vector = []
-    for cluster in all_clusters:
-        similarity = similarities.get((question, cluster), 0.0)
-        scaled_similarity = similarity * cluster_weights[cluster]
-        embedding_vector.append(scaled_similarity)
-    embedding_matrix.append(embedding_vector)
-
-embedding_matrix = np.array(embedding_matrix)
+embedding_matrix = similarity_matrix * cluster_weights
 
 # %%
-# Apply t-SNE
+# Apply t-SNE, reusing the saved layout for known questions
 print("Applying t-SNE...")
-tsne = TSNE(n_components=2, random_state=42, perplexity=30, max_iter=1000)
-embeddings_2d = tsne.fit_transform(embedding_matrix)
+embeddings_2d = update_layout(
+    questions,
+    embedding_matrix,
+    layout_path=PROJECTION_LAYOUT_PATH,
+    refit=REFIT_PROJECTION,
+    method=PROJECTION_METHOD,
+    perplexity=30,
+    max_iter=1000,
+)
 
 # %%
 # Create mapping from questions to cluster_1 for coloring
@@ -0,0 +1,160 @@
+"""
+Persistent, content-addressed cache for text embeddings.
+
+Each (model name, max_length, pooling) combination gets its own directory
+holding an appendable float32 matrix (vectors.f32, read through np.memmap) and
+an append-only index (index.tsv) mapping a text's SHA-256 to its row. A small
+in-memory LRU sits in front of the memmap for repeated lookups.
+
+Several processes may share a cache directory (e.g. pipeline stages running
+in parallel): appends take an exclusive lock on the directory's lock file and
+index reads a shared one, where fcntl is available.
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the cache is then single-process only
+    fcntl = None
+
+DEFAULT_CACHE_DIR = ".embedding_cache"
+DEFAULT_MAX_MEMORY_ENTRIES = 10_000
+
+VECTORS_FILENAME = "vectors.f32"
+INDEX_FILENAME = "index.tsv"
+LOCK_FILENAME = ".lock"
+
+
+def hash_text(text: str) -> str:
+    """Content hash used as the per-text cache key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk embedding store with an LRU-bounded in-memory layer."""
+
+    def __init__(
+        self,
+        model_name: str,
+        max_length: int,
+        pooling: str,
+        dim: int,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES,
+    ):
+        namespace = f"{model_name}|{max_length}|{pooling}"
+        slug = model_name.replace("/", "__")
+        self.path = Path(cache_dir) / f"{slug}-{hash_text(namespace)[:12]}"
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.max_length = max_length
+        self.pooling = pooling
+        self.dim = dim
+        self.max_memory_entries = max_memory_entries
+
+        self._vectors_path = self.path / VECTORS_FILENAME
+        self._index_path = self.path / INDEX_FILENAME
+        self._lock_path = self.path / LOCK_FILENAME
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._memmap = None
+        self.hits = 0
+        self.misses = 0
+
+        self._index: dict[str, int] = {}
+        with self._locked(exclusive=False):
+            num_rows = self._num_rows_on_disk()
+            if self._index_path.exists():
+                with open(self._index_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        text_hash, _, row = line.rstrip("\n").partition("\t")
+                        # Ignore index lines whose vector write never completed
+                        if row and int(row) < num_rows:
+                            self._index[text_hash] = int(row)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """Hold the cache directory's lock, shared by every process using it."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _num_rows_on_disk(self) -> int:
+        if not self._vectors_path.exists():
+            return 0
+        return os.path.getsize(self._vectors_path) // (self.dim * 4)
+
+    def _vectors(self) -> np.ndarray:
+        """Read-only memmap over every row written so far."""
+        num_rows = self._num_rows_on_disk()
+        if self._memmap is None or self._memmap.shape[0] != num_rows:
+            self._memmap = np.memmap(
+                self._vectors_path, dtype=np.float32, mode="r", shape=(num_rows, self.dim)
+            )
+        return self._memmap
+
+    def _remember(self, text_hash: str, vector: np.ndarray) -> None:
+        self._memory[text_hash] = vector
+        self._memory.move_to_end(text_hash)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str):
+        """Return the cached vector for text, or None if it has not been embedded."""
+        text_hash = hash_text(text)
+        if text_hash in self._memory:
+            self._memory.move_to_end(text_hash)
+            self.hits += 1
+            return self._memory[text_hash]
+        row = self._index.get(text_hash)
+        if row is None:
+            self.misses += 1
+            return None
+        vector = np.array(self._vectors()[row])
+        self._remember(text_hash, vector)
+        self.hits += 1
+        return vector
+
+    def put_many(self, texts: list[str], vectors: np.ndarray) -> None:
+        """Append new vectors to disk and record them in the index."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        new_rows = []
+        seen = set()
+        for text, vector in zip(texts, vectors):
+            text_hash = hash_text(text)
+            if text_hash not in self._index and text_hash not in seen:
+                new_rows.append((text_hash, vector))
+                seen.add(text_hash)
+            self._remember(text_hash, vector)
+        if not new_rows:
+            return
+
+        # The row count is read under the lock, so another process's append
+        # can neither be truncated nor share our rows
+        with self._locked():
+            start_row = self._num_rows_on_disk()
+            # Vectors are written before the index so a crash never leaves an
+            # index entry pointing past the end of the matrix. Truncating first
+            # drops any half-written row left by an earlier crash.
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(start_row * self.dim * 4)
+                f.write(np.stack([vector for _, vector in new_rows]).tobytes())
+            with open(self._index_path, "a", encoding="utf-8") as f:
+                for offset, (text_hash, _) in enumerate(new_rows):
+                    f.write(f"{text_hash}\t{start_row + offset}\n")
+                    self._index[text_hash] = start_row + offset
@@ -0,0 +1,188 @@
+"""
+Batched BERT mean-pooling embeddings shared by embedding.py and embedding copy.py.
+
+Texts are tokenized once, sorted by token length and run through the model in
+padded batches, so each forward pass does useful work instead of running at
+batch size 1. Passing an EmbeddingCache skips texts embedded on earlier runs.
+"""
+
+from functools import cache
+
+import numpy as np
+import torch
+from tqdm import tqdm
+from transformers import AutoModel, AutoTokenizer
+
+from embedding_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_MEMORY_ENTRIES, EmbeddingCache
+
+DEFAULT_MODEL_NAME = "bert-base-uncased"
+DEFAULT_MAX_LENGTH = 512
+DEFAULT_BATCH_SIZE = 32
+POOLING = "mean"
+
+
+@cache
+def get_model_and_tokenizer(
+    model_name: str = DEFAULT_MODEL_NAME,
+) -> tuple[AutoTokenizer, AutoModel]:
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    return tokenizer, model.eval()
+
+
+def _mean_pool(embeddings: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+    """Average token embeddings over the non-padding positions of each row."""
+    mask_expanded = attention_mask.unsqueeze(-1).expand(embeddings.size()).float()
+    sum_embeddings = torch.sum(embeddings * mask_expanded, dim=1)
+    sum_mask = torch.clamp(mask_expanded.sum(dim=1), min=1e-9)
+    return sum_embeddings / sum_mask
+
+
+def l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length; all-zero rows stay zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms != 0)
+
+
+def open_embedding_cache(
+    model_name: str = DEFAULT_MODEL_NAME,
+    max_length: int = DEFAULT_MAX_LENGTH,
+    cache_dir: str = DEFAULT_CACHE_DIR,
+    max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES,
+) -> EmbeddingCache:
+    """Open the persistent cache for this model's mean-pooled embeddings."""
+    _, model = get_model_and_tokenizer(model_name)
+    return EmbeddingCache(
+        model_name,
+        max_length,
+        POOLING,
+        model.config.hidden_size,
+        cache_dir=cache_dir,
+        max_memory_entries=max_memory_entries,
+    )
+
+
+def embed_texts(
+    texts: list[str],
+    model_name: str = DEFAULT_MODEL_NAME,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    num_threads: int = None,
+    max_length: int = DEFAULT_MAX_LENGTH,
+    show_progress: bool = True,
+    cache: EmbeddingCache = None,
+) -> np.ndarray:
+    """
+    Embed a list of texts with mean pooling over padded, length-sorted batches.
+
+    Args:
+        texts: The texts to embed
+        model_name: Hugging Face model to load with AutoModel
+        batch_size: Number of texts per forward pass
+        num_threads: Torch intra-op thread count. If None, keeps the torch default.
+        max_length: Token limit; longer texts are truncated
+        show_progress: Whether to show a tqdm progress bar over batches
+        cache: Optional persistent cache; only texts missing from it are embedded
+
+    Returns:
+        A float32 array of shape (len(texts), hidden_size), rows in input order
+    """
+    texts = list(texts)
+    if cache is None:
+        return _embed_uncached(texts, model_name, batch_size, num_threads, max_length, show_progress)
+
+    if (cache.model_name, cache.max_length, cache.pooling) != (model_name, max_length, POOLING):
+        raise ValueError(
+            f"Cache is for ({cache.model_name}, {cache.max_length}, {cache.pooling}), "
+            f"not ({model_name}, {max_length}, {POOLING})"
+        )
+
+    cached = [cache.get(text) for text in texts]
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+    # Counted over distinct texts: a repeated text is embedded once either way
+    num_distinct = len(dict.fromkeys(texts))
+    print(f"Embedding cache: {num_distinct - len(missing)} cached, {len(missing)} to embed")
+
+    new_vectors = _embed_uncached(missing, model_name, batch_size, num_threads, max_length, show_progress)
+    cache.put_many(missing, new_vectors)
+    missing_to_vector = dict(zip(missing, new_vectors))
+
+    output = np.empty((len(texts), cache.dim), dtype=np.float32)
+    for i, (text, vector) in enumerate(zip(texts, cached)):
+        output[i] = vector if vector is not None else missing_to_vector[text]
+    return output
+
+
+@cache
+def _shared_embedding_cache(model_name: str, max_length: int) -> EmbeddingCache:
+    return open_embedding_cache(model_name, max_length)
+
+
+def paired_cosine_similarity(
+    texts_A: list[str], texts_B: list[str], use_cache: bool = True, **embed_kwargs
+) -> np.ndarray:
+    """
+    Cosine similarity between texts_A[i] and texts_B[i] for every i.
+
+    Each distinct text is embedded once, however many pairs it appears in (a
+    base output is usually paired with every variant of its question), in one
+    embed_texts call; embed_kwargs are passed through to it. Unless a cache is
+    passed or use_cache is False, the persistent cache in DEFAULT_CACHE_DIR is
+    used, so re-runs only embed new outputs.
+
+    Returns:
+        A float32 array of shape (len(texts_A),)
+    """
+    texts_A, texts_B = list(texts_A), list(texts_B)
+    if len(texts_A) != len(texts_B):
+        raise ValueError(f"Got {len(texts_A)} A texts but {len(texts_B)} B texts")
+    if use_cache and embed_kwargs.get("cache") is None:
+        embed_kwargs["cache"] = _shared_embedding_cache(
+            embed_kwargs.get("model_name", DEFAULT_MODEL_NAME), embed_kwargs.get("max_length", DEFAULT_MAX_LENGTH)
+        )
+
+    unique_texts = list(dict.fromkeys(texts_A + texts_B))
+    row_of = {text: row for row, text in enumerate(unique_texts)}
+    embeddings = l2_normalize(embed_texts(unique_texts, **embed_kwargs))
+    rows_A = np.array([row_of[text] for text in texts_A], dtype=np.intp)
+    rows_B = np.array([row_of[text] for text in texts_B], dtype=np.intp)
+    return np.einsum("nd,nd->n", embeddings[rows_A], embeddings[rows_B])
+
+
+@torch.no_grad()
+def _embed_uncached(
+    texts: list[str],
+    model_name: str,
+    batch_size: int,
+    num_threads: int,
+    max_length: int,
+    show_progress: bool,
+) -> np.ndarray:
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+    tokenizer, model = get_model_and_tokenizer(model_name)
+    output = np.empty((len(texts), model.config.hidden_size), dtype=np.float32)
+    if not texts:
+        return output
+
+    # Tokenize once without padding, then sort by length so each batch only
+    # pads up to its own longest member
+    encoded = tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+    order = np.argsort([len(ids) for ids in encoded], kind="stable")
+
+    batch_starts = range(0, len(order), batch_size)
+    if show_progress:
+        batch_starts = tqdm(batch_starts, desc="Embedding batches")
+
+    for start in batch_starts:
+        batch_indices = order[start : start + batch_size]
+        inputs = tokenizer.pad(
+            {"input_ids": [encoded[i] for i in batch_indices]},
+            padding=True,
+            return_tensors="pt",
+        )
+        outputs = model(**inputs)
+        pooled = _mean_pool(outputs.last_hidden_state, inputs["attention_mask"])
+        output[batch_indices] = pooled.numpy()
+
+    return output
@@ -0,0 +1,126 @@
+"""
+Columnar on-disk format for question fingerprints and t-SNE coordinates.
+
+An artifact is a directory holding:
+    fingerprints.npy  (num_questions, num_clusters) fingerprint matrix
+    tsne_xy.npy       (num_questions, 2) projected coordinates
+    metadata.csv      one row per question row: question, clusters, vector_index
+    manifest.json     fingerprint column labels and hierarchy weights
+
+Rows of metadata.csv point into the arrays through vector_index, so duplicate
+question rows share one fingerprint. The arrays are plain .npy files and are
+opened with np.load(mmap_mode="r"), so loading does not copy them into memory.
+"""
+
+import csv
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+ARTIFACT_VERSION = 1
+
+FINGERPRINTS_FILENAME = "fingerprints.npy"
+TSNE_FILENAME = "tsne_xy.npy"
+METADATA_FILENAME = "metadata.csv"
+MANIFEST_FILENAME = "manifest.json"
+
+METADATA_FIELDS = ["question", "cluster_1", "cluster_2", "cluster_3", "vector_index"]
+
+
+@dataclass
+class FingerprintArtifact:
+    """A loaded artifact; array rows follow `questions`."""
+    metadata: list[dict]
+    questions: list[str]
+    fingerprints: np.ndarray
+    tsne_xy: np.ndarray
+    manifest: dict
+
+    def coordinates(self) -> dict[str, tuple[float, float]]:
+        """Map each question to its (x, y) coordinates."""
+        return {
+            question: (float(x), float(y))
+            for question, (x, y) in zip(self.questions, self.tsne_xy)
+        }
+
+
+def save_fingerprint_artifact(
+    path: str,
+    rows: list[dict],
+    questions: list[str],
+    fingerprints: np.ndarray,
+    tsne_xy: np.ndarray,
+    fingerprint_columns: list[str] = None,
+    hierarchy_weights: dict = None,
+) -> None:
+    """
+    Write an artifact directory.
+
+    Args:
+        path: Directory to write (created if missing)
+        rows: Question rows with question, cluster_1, cluster_2, cluster_3 keys
+        questions: Unique questions, in the row order of fingerprints and tsne_xy
+        fingerprints: (len(questions), num_clusters) fingerprint matrix
+        tsne_xy: (len(questions), 2) coordinates
+        fingerprint_columns: Optional label for each fingerprint column
+        hierarchy_weights: Optional weights used to build the fingerprints
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    np.save(path / FINGERPRINTS_FILENAME, np.ascontiguousarray(fingerprints))
+    np.save(path / TSNE_FILENAME, np.ascontiguousarray(tsne_xy))
+
+    question_to_index = {question: i for i, question in enumerate(questions)}
+    with open(path / METADATA_FILENAME, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=METADATA_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({
+                "question": row["question"],
+                "cluster_1": row["cluster_1"],
+                "cluster_2": row["cluster_2"],
+                "cluster_3": row["cluster_3"],
+                "vector_index": question_to_index[row["question"]],
+            })
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "num_questions": len(questions),
+        "fingerprint_columns": fingerprint_columns,
+        "hierarchy_weights": hierarchy_weights,
+    }
+    with open(path / MANIFEST_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+
+def load_fingerprint_artifact(path: str, mmap: bool = True) -> FingerprintArtifact:
+    """Open an artifact directory; arrays are memory-mapped unless mmap is False."""
+    path = Path(path)
+    mmap_mode = "r" if mmap else None
+
+    with open(path / MANIFEST_FILENAME, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported fingerprint artifact version: {manifest.get('version')}")
+
+    fingerprints = np.load(path / FINGERPRINTS_FILENAME, mmap_mode=mmap_mode)
+    tsne_xy = np.load(path / TSNE_FILENAME, mmap_mode=mmap_mode)
+
+    metadata = []
+    questions = [None] * manifest["num_questions"]
+    with open(path / METADATA_FILENAME, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            row["vector_index"] = int(row["vector_index"])
+            questions[row["vector_index"]] = row["question"]
+            metadata.append(row)
+
+    return FingerprintArtifact(
+        metadata=metadata,
+        questions=questions,
+        fingerprints=fingerprints,
+        tsne_xy=tsne_xy,
+        manifest=manifest,
+    )
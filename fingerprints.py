@@ -0,0 +1,156 @@
+"""
+Cluster centroids and fingerprints for questions, used by embedding copy.py.
+
+Centroids for all three hierarchy levels are accumulated in one pass over the
+embedding matrix. A fingerprint is the cosine similarity of a question
+embedding to every cluster centroid at all three levels, weighted per level.
+All questions are fingerprinted at once with one matmul per level.
+"""
+
+import numpy as np
+
+from embedding_engine import l2_normalize
+
+# Similarity assigned to the cluster a question actually belongs to
+OWN_CLUSTER_SIMILARITY = 0.9
+
+DEFAULT_HIERARCHY_WEIGHTS = {"cluster_1": 1.0, "cluster_2": 0.5, "cluster_3": 0.25}
+
+CLUSTER_LEVELS = ("cluster_1", "cluster_2", "cluster_3")
+
+
+class CentroidAccumulator:
+    """
+    Running per-cluster embedding sums and counts for every hierarchy level.
+
+    Cluster names are mapped to integer codes in order of first appearance,
+    and rows are folded in with np.add.at, so adding new questions only
+    touches the new rows instead of recomputing every centroid.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self._codes = {level: {} for level in CLUSTER_LEVELS}
+        self._sums = {level: np.zeros((0, dim), dtype=np.float64) for level in CLUSTER_LEVELS}
+        self._counts = {level: np.zeros(0, dtype=np.int64) for level in CLUSTER_LEVELS}
+
+    def add(self, embeddings: np.ndarray, labels: dict) -> None:
+        """
+        Fold rows into the running sums.
+
+        Args:
+            embeddings: (N, dim) matrix, one row per question row
+            labels: Dict mapping each level in CLUSTER_LEVELS to its N cluster names
+        """
+        embeddings = np.asarray(embeddings)
+        for level in CLUSTER_LEVELS:
+            name_to_code = self._codes[level]
+            codes = np.array(
+                [name_to_code.setdefault(name, len(name_to_code)) for name in labels[level]],
+                dtype=np.intp,
+            )
+
+            # Grow the accumulators for clusters seen for the first time
+            num_new = len(name_to_code) - len(self._counts[level])
+            if num_new:
+                self._sums[level] = np.vstack([self._sums[level], np.zeros((num_new, self.dim))])
+                self._counts[level] = np.concatenate([self._counts[level], np.zeros(num_new, dtype=np.int64)])
+
+            np.add.at(self._sums[level], codes, embeddings)
+            self._counts[level] += np.bincount(codes, minlength=len(name_to_code))
+
+    def centroids(self, level: str) -> dict:
+        """Centroid data for one level, in the format create_fingerprints expects."""
+        sums, counts = self._sums[level], self._counts[level]
+        return {
+            name: {
+                "centroid": (sums[code] / counts[code]).astype(np.float32),
+                "num_questions": int(counts[code]),
+            }
+            for name, code in self._codes[level].items()
+            if counts[code] > 0
+        }
+
+
+def _level_fingerprints(
+    normalized_embeddings: np.ndarray,
+    centroids: dict,
+    cluster_names: list,
+    question_clusters: list,
+    weight: float,
+) -> np.ndarray:
+    """Weighted similarities of every question to every centroid of one level."""
+    dim = normalized_embeddings.shape[1]
+    has_centroid = np.array([name in centroids for name in cluster_names], dtype=bool)
+    centroid_matrix = np.zeros((len(cluster_names), dim), dtype=normalized_embeddings.dtype)
+    for i, name in enumerate(cluster_names):
+        if name in centroids:
+            centroid_matrix[i] = centroids[name]["centroid"]
+
+    # Similarities keep the embedding dtype; the result is widened afterwards
+    # so the fixed own-cluster value is stored exactly
+    similarities = (normalized_embeddings @ l2_normalize(centroid_matrix).T) * weight
+    similarities = similarities.astype(np.float64)
+
+    own_cluster = (
+        np.asarray(question_clusters, dtype=object)[:, None]
+        == np.asarray(cluster_names, dtype=object)[None, :]
+    )
+    similarities[own_cluster] = OWN_CLUSTER_SIMILARITY * weight
+
+    # Clusters without a centroid contribute a zero column
+    similarities[:, ~has_centroid] = 0.0
+    return similarities
+
+
+def create_fingerprints(
+    embeddings: np.ndarray,
+    centroids_cluster_1: dict,
+    centroids_cluster_2: dict,
+    centroids_cluster_3: dict,
+    clusters_1: list,
+    clusters_2: list,
+    clusters_3: list,
+    question_clusters_1: list,
+    question_clusters_2: list,
+    question_clusters_3: list,
+    weights: dict = None,
+) -> np.ndarray:
+    """
+    Create fingerprint vectors for many questions by computing cosine similarity
+    against each cluster centroid, weighted by hierarchy.
+    If a question belongs to a cluster, that similarity is set to OWN_CLUSTER_SIMILARITY.
+
+    Args:
+        embeddings: (N, dim) matrix of question embeddings
+        centroids_cluster_1: Dict mapping cluster_1 names to centroid data
+        centroids_cluster_2: Dict mapping cluster_2 names to centroid data
+        centroids_cluster_3: Dict mapping cluster_3 names to centroid data
+        clusters_1: Sorted list of cluster_1 names (for consistent ordering)
+        clusters_2: Sorted list of cluster_2 names (for consistent ordering)
+        clusters_3: Sorted list of cluster_3 names (for consistent ordering)
+        question_clusters_1: The cluster_1 assignment for each question
+        question_clusters_2: The cluster_2 assignment for each question
+        question_clusters_3: The cluster_3 assignment for each question
+        weights: Dict mapping cluster level to weight (default: cluster_1=1.0, cluster_2=0.5, cluster_3=0.25)
+
+    Returns:
+        A (N, len(clusters_1) + len(clusters_2) + len(clusters_3)) float64 array
+        Order: all cluster_1 similarities, then cluster_2, then cluster_3
+    """
+    if weights is None:
+        weights = DEFAULT_HIERARCHY_WEIGHTS
+
+    normalized_embeddings = l2_normalize(np.asarray(embeddings))
+    levels = [
+        (centroids_cluster_1, clusters_1, question_clusters_1, weights["cluster_1"]),
+        (centroids_cluster_2, clusters_2, question_clusters_2, weights["cluster_2"]),
+        (centroids_cluster_3, clusters_3, question_clusters_3, weights["cluster_3"]),
+    ]
+    return np.concatenate(
+        [
+            _level_fingerprints(normalized_embeddings, centroids, names, assigned, weight)
+            for centroids, names, assigned, weight in levels
+        ],
+        axis=1,
+    )
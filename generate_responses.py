@@ -0,0 +1,374 @@
+"""
+Generate model responses for every (question, prompt variant) combination.
+
+A prompt variant is a system prompt, a context seed (earlier chat turns placed
+before the question, as in generate_mock_data.COMPARISONS), or both. Every
+question is asked under every variant on a bounded thread pool sharing one
+pooled client, with rate limiting and retries from llm_runtime. Finished
+completions are appended to an NDJSON checkpoint, so an interrupted run
+resumes where it stopped. At the end the checkpoint is written out as a
+responses CSV in the responses_with_system_prompts2.csv format, ready for
+combine_csvs.py. Works against any OpenAI-compatible server via base_url.
+
+Requests are planned around their shared prefix (system prompt plus context
+seed). One leader request per prefix goes first, to warm the provider's prompt
+cache; the rest follow in prefix-contiguous order and carry a prompt_cache_key
+hint, so the prefix is prefilled once per variant rather than once per question.
+Cached-token ratios from the usage reports are printed at the end.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from llm_runtime import (
+    DEFAULT_MAX_RETRIES,
+    RateLimiter,
+    call_with_retries,
+    connection_stats,
+    estimate_tokens,
+    get_shared_client,
+    rejects_parameter,
+)
+from ndjson_checkpoint import read_checkpoint, score_to_checkpoint
+
+load_dotenv()
+
+RESPONSE_FIELDNAMES = ["system_prompt_index", "system_prompt", "question", "thoughts", "response"]
+DEFAULT_MAX_TOKENS = 2048
+DEFAULT_CONCURRENCY = 32
+
+_THINK_RE = re.compile(r"^\s*<think>(.*?)</think>\s*", re.DOTALL)
+
+
+@dataclass
+class PromptVariant:
+    """A system prompt and/or context seed placed before each question."""
+    system_prompt: str = ""
+    context_seed: list[dict] = field(default_factory=list)
+
+    def messages(self, question: str) -> list[dict]:
+        messages = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+        return messages + list(self.context_seed) + [{"role": "user", "content": question}]
+
+    def prefix_key(self) -> str:
+        """Hash of the messages shared by every question asked under this variant."""
+        prefix = json.dumps(self.messages("")[:-1], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+
+    def label(self) -> str:
+        """Text for the system_prompt column; variants with a context seed are written as JSON."""
+        if not self.context_seed:
+            return self.system_prompt
+        return json.dumps(
+            {"system_prompt": self.system_prompt, "context_seed": self.context_seed}, ensure_ascii=False
+        )
+
+
+def load_variants(path: str) -> list[PromptVariant]:
+    """
+    Load prompt variants from a file.
+
+    A .json file holds a list whose items are either system prompt strings or
+    objects with optional "system_prompt" and "context_seed" keys. A .csv file
+    is read as an existing responses CSV, and its distinct system prompts are
+    reused in system_prompt_index order.
+    """
+    if Path(path).suffix == ".csv":
+        by_index = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                by_index.setdefault(int(row["system_prompt_index"]), row["system_prompt"])
+        return [PromptVariant(system_prompt=by_index[i]) for i in sorted(by_index)]
+
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    return [
+        PromptVariant(system_prompt=item) if isinstance(item, str)
+        else PromptVariant(item.get("system_prompt", ""), item.get("context_seed", []))
+        for item in items
+    ]
+
+
+def load_questions(path: str, limit: int = None) -> list[str]:
+    """Read the distinct questions, in file order, from a CSV with a question column."""
+    with open(path, "r", encoding="utf-8") as f:
+        questions = dict.fromkeys(row["question"].strip() for row in csv.DictReader(f))
+    questions = [question for question in questions if question]
+    return questions[:limit] if limit else questions
+
+
+def _split_thoughts(message) -> tuple[str, str]:
+    """Separate reasoning from the answer (reasoning_content field or a leading <think> block)."""
+    content = message.content or ""
+    thoughts = getattr(message, "reasoning_content", None) or ""
+    match = _THINK_RE.match(content)
+    if match:
+        thoughts = thoughts or match.group(1).strip()
+        content = content[match.end():]
+    return thoughts, content.strip()
+
+
+def plan_prefix_groups(jobs: list[dict], variants: list[PromptVariant]) -> tuple[list[dict], list[dict]]:
+    """
+    Order jobs so requests sharing a prompt prefix are issued together.
+
+    Variants with identical prefixes share a group. Returns (leaders, followers):
+    the first job of each group, to be sent before anything else so the
+    prefix is cached, and the remaining jobs grouped contiguously by prefix.
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(variants[job["variant_index"]].prefix_key(), []).append(job)
+    leaders = [group[0] for group in groups.values()]
+    followers = [job for group in groups.values() for job in group[1:]]
+    return leaders, followers
+
+
+class PrefixCacheStats:
+    """Prompt and cached prompt tokens reported by the provider, per prefix."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompt_tokens = {}
+        self.cached_tokens = {}
+
+    def record(self, prefix_key: str, usage) -> None:
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        with self._lock:
+            self.prompt_tokens[prefix_key] = self.prompt_tokens.get(prefix_key, 0) + prompt_tokens
+            self.cached_tokens[prefix_key] = self.cached_tokens.get(prefix_key, 0) + cached_tokens
+
+    def summary(self) -> str:
+        prompt_tokens = sum(self.prompt_tokens.values())
+        if not prompt_tokens:
+            return "no usage reported"
+        cached_tokens = sum(self.cached_tokens.values())
+        ratios = [
+            self.cached_tokens[key] / total for key, total in self.prompt_tokens.items() if total
+        ]
+        return (
+            f"{cached_tokens} of {prompt_tokens} prompt tokens cached ({cached_tokens / prompt_tokens:.0%}); "
+            f"per prefix {min(ratios):.0%}-{max(ratios):.0%} across {len(ratios)} prefixes"
+        )
+
+
+def job_id(variant: PromptVariant, question: str) -> str:
+    """
+    Content key for one (variant, question) request.
+
+    Built from the variant's prefix hash and a hash of the question text, so a
+    checkpoint stays matched to the right work when questions or variants are
+    added, removed or reordered between runs.
+    """
+    question_hash = hashlib.sha256(question.encode("utf-8")).hexdigest()[:16]
+    return f"{variant.prefix_key()}:{question_hash}"
+
+
+def _write_responses_csv(checkpoint_path: str, output_file: str, ordered_jobs: list[dict]) -> int:
+    """Write checkpointed responses to output_file in ordered_jobs order; returns the row count."""
+    offsets = read_checkpoint(checkpoint_path)
+    tmp_file = f"{output_file}.tmp"
+    count = 0
+    with open(checkpoint_path, "rb") as checkpoint, open(tmp_file, "w", encoding="utf-8", newline="") as out:
+        writer = csv.DictWriter(out, fieldnames=RESPONSE_FIELDNAMES, extrasaction="ignore")
+        writer.writeheader()
+        for job in ordered_jobs:
+            if job["id"] not in offsets:
+                continue
+            checkpoint.seek(offsets[job["id"]])
+            row = json.loads(checkpoint.readline())
+            # A resumed row may have been generated when the variant sat at another index
+            row["system_prompt_index"] = job["variant_index"]
+            writer.writerow(row)
+            count += 1
+    os.replace(tmp_file, output_file)
+    return count
+
+
+def generate_responses(
+    questions: list[str],
+    variants: list[PromptVariant],
+    output_file: str = "responses_with_system_prompts.csv",
+    model: str = "gpt-4o-mini",
+    llm_client=None,
+    base_url: str = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_tokens: int = DEFAULT_MAX_TOKENS,
+    temperature: float = None,
+    requests_per_minute: float = None,
+    tokens_per_minute: float = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    resume: bool = False,
+    prompt_cache_hints: bool = True,
+) -> int:
+    """
+    Ask every question under every variant and write the responses CSV.
+
+    Rows are ordered by question, then by variant, like the existing responses
+    CSV. Requests that still fail after retries are left out of the checkpoint,
+    so running again with resume=True retries only those. Checkpoint rows are
+    keyed by content (see job_id), so resuming after editing the question or
+    variant lists reuses only responses to the same messages; a question
+    repeated under the same variant is asked once.
+
+    Args:
+        questions: Questions to ask
+        variants: Prompt variants; their position is the system_prompt_index
+        output_file: Responses CSV to write; the checkpoint sits next to it as .ndjson
+        model: Model to generate with
+        llm_client: An OpenAI-compatible client. If None, uses the shared pooled client for base_url.
+        base_url: OpenAI-compatible server, e.g. a local stub, when llm_client is None
+        concurrency: Maximum number of requests in flight
+        max_tokens: Completion limit per response
+        temperature: Sampling temperature; None keeps the server default
+        requests_per_minute: Optional request throttle across all workers
+        tokens_per_minute: Optional (estimated) token throttle across all workers
+        max_retries: Retries with exponential backoff on 429/5xx errors
+        resume: Keep the existing checkpoint and only generate missing responses
+        prompt_cache_hints: Send each request's prefix hash as prompt_cache_key. Dropped
+            for the rest of the run if the server rejects it with a 400 that names it.
+
+    Returns:
+        Number of rows written
+    """
+    jobs_by_id = {}
+    for question in questions:
+        for variant_index, variant in enumerate(variants):
+            job = {"id": job_id(variant, question), "variant_index": variant_index, "question": question}
+            jobs_by_id.setdefault(job["id"], job)
+    all_jobs = list(jobs_by_id.values())
+    checkpoint_path = str(Path(output_file).with_suffix(".ndjson"))
+
+    if resume and os.path.exists(checkpoint_path):
+        done_ids = read_checkpoint(checkpoint_path)
+        jobs = [job for job in all_jobs if job["id"] not in done_ids]
+        print(f"Resuming: {len(all_jobs) - len(jobs)} responses already in {checkpoint_path}")
+    else:
+        open(checkpoint_path, "w").close()
+        jobs = all_jobs
+
+    if llm_client is None:
+        llm_client = get_shared_client(base_url, max_connections=max(concurrency, 1))
+    rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    connection_stats.reset()
+    extra_kwargs = {} if temperature is None else {"temperature": temperature}
+    failures = 0
+    completion_tokens = 0
+    counter_lock = threading.Lock()
+    cache_stats = PrefixCacheStats()
+    send_hints = prompt_cache_hints
+
+    def generate(job: dict) -> list[dict]:
+        nonlocal failures, completion_tokens, send_hints
+        variant = variants[job["variant_index"]]
+        messages = variant.messages(job["question"])
+        prefix_key = variant.prefix_key()
+
+        def request():
+            nonlocal send_hints
+            prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+            rate_limiter.acquire(prompt_tokens + max_tokens)
+            if send_hints:
+                try:
+                    return llm_client.chat.completions.create(
+                        model=model,
+                        max_tokens=max_tokens,
+                        messages=messages,
+                        extra_body={"prompt_cache_key": prefix_key},
+                        **extra_kwargs,
+                    )
+                except Exception as e:
+                    if not rejects_parameter(e, "prompt_cache_key"):
+                        raise
+                    print(f"Server rejected prompt_cache_key ({e}); continuing without it")
+                    send_hints = False
+            return llm_client.chat.completions.create(
+                model=model, max_tokens=max_tokens, messages=messages, **extra_kwargs
+            )
+
+        try:
+            completion = call_with_retries(request, max_retries=max_retries)
+        except Exception as e:
+            print(f"Error generating {job['id']}: {e}")
+            with counter_lock:
+                failures += 1
+            return []
+
+        usage = getattr(completion, "usage", None)
+        cache_stats.record(prefix_key, usage)
+        with counter_lock:
+            completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+        thoughts, response = _split_thoughts(completion.choices[0].message)
+        return [{
+            "id": job["id"],
+            "system_prompt_index": job["variant_index"],
+            "system_prompt": variant.label(),
+            "question": job["question"],
+            "thoughts": thoughts,
+            "response": response,
+        }]
+
+    leaders, followers = plan_prefix_groups(jobs, variants)
+    print(
+        f"Generating {len(jobs)} responses ({len(questions)} questions x {len(variants)} variants, "
+        f"{len(leaders)} distinct prefixes)..."
+    )
+    start = time.perf_counter()
+    # Leaders finish first so followers find their prefix already cached
+    score_to_checkpoint(leaders, generate, checkpoint_path, concurrency)
+    score_to_checkpoint(followers, generate, checkpoint_path, concurrency)
+    elapsed = time.perf_counter() - start
+
+    count = _write_responses_csv(checkpoint_path, output_file, all_jobs)
+    print(f"\nWrote {count} responses to {output_file} ({failures} failed, rerun with resume to retry)")
+    if jobs and elapsed > 0:
+        print(
+            f"Throughput: {(len(jobs) - failures) / elapsed:.1f} responses/s, "
+            f"{completion_tokens / elapsed:.0f} completion tokens/s over {elapsed:.1f}s"
+        )
+    print(f"Prompt cache: {cache_stats.summary()}")
+    print(f"Connections: {connection_stats.summary()}")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate responses for every question under every prompt variant.")
+    parser.add_argument("--questions-file", default="questions.csv")
+    parser.add_argument(
+        "--variants-file",
+        default="responses_with_system_prompts2.csv",
+        help="JSON list of system prompts / {system_prompt, context_seed} objects, or a responses CSV to reuse",
+    )
+    parser.add_argument("--output-file", default="responses_with_system_prompts.csv")
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible server URL")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--max-tokens", type=int, default=DEFAULT_MAX_TOKENS)
+    parser.add_argument("--limit", type=int, default=None, help="Only use the first N questions")
+    parser.add_argument("--resume", action="store_true", help="Skip responses already in the checkpoint")
+    parser.add_argument("--no-cache-hints", action="store_true", help="Do not send prompt_cache_key hints")
+    args = parser.parse_args()
+
+    generate_responses(
+        load_questions(args.questions_file, args.limit),
+        load_variants(args.variants_file),
+        output_file=args.output_file,
+        model=args.model,
+        base_url=args.base_url,
+        concurrency=args.concurrency,
+        max_tokens=args.max_tokens,
+        resume=args.resume,
+        prompt_cache_hints=not args.no_cache_hints,
+    )
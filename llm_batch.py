@@ -0,0 +1,169 @@
+"""
+Batch-API submission for large scoring runs.
+
+Requests are rendered into a JSONL file in the OpenAI batch input format,
+submitted through a backend, polled until finished, and read back as
+(custom_id, response text or error) pairs. Two backends are provided:
+
+    OpenAIBatchBackend  Uploads the file and runs it through the Batch API
+    LocalBatchBackend   File-based fake that answers each request locally,
+                        for tests and dry runs without network access
+"""
+
+import json
+import shutil
+import time
+import uuid
+from pathlib import Path
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+DEFAULT_POLL_INTERVAL = 30.0
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def write_batch_file(
+    requests: list[dict], path: str, model: str, max_tokens: int, response_format: dict = None
+) -> int:
+    """
+    Render chat requests into a batch input JSONL file.
+
+    Args:
+        requests: Dicts with "custom_id" and "messages"
+        path: JSONL file to write
+        model: Model for every request
+        max_tokens: Completion limit for every request
+        response_format: Optional structured-output constraint for every request
+
+    Returns:
+        Number of requests written
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for request in requests:
+            line = {
+                "custom_id": request["custom_id"],
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": {
+                    "model": model,
+                    "max_tokens": max_tokens,
+                    "messages": request["messages"],
+                },
+            }
+            if response_format is not None:
+                line["body"]["response_format"] = response_format
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def parse_batch_output(lines) -> dict[str, tuple[str, str]]:
+    """
+    Map custom_id to (response text, error) from batch output JSONL lines.
+
+    Exactly one of the two is None for each id.
+    """
+    results = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        body = response.get("body") or {}
+        if record.get("error") or response.get("status_code", 200) != 200:
+            error = record.get("error") or body.get("error") or f"status {response.get('status_code')}"
+            results[record["custom_id"]] = (None, str(error))
+        else:
+            results[record["custom_id"]] = (body["choices"][0]["message"]["content"], None)
+    return results
+
+
+class OpenAIBatchBackend:
+    """Runs batch files through the OpenAI Batch API."""
+
+    def __init__(self, client=None, completion_window: str = "24h"):
+        if client is None:
+            from llm_runtime import get_shared_client
+            client = get_shared_client()
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, path: str) -> str:
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def fetch_results(self, batch_id: str) -> dict[str, tuple[str, str]]:
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                lines.extend(self.client.files.content(file_id).text.splitlines())
+        return parse_batch_output(lines)
+
+
+class LocalBatchBackend:
+    """
+    File-based fake batch backend.
+
+    Each submitted file is copied into its own directory under `directory` and
+    answered immediately by calling responder(request_body) -> response text.
+    Output is written in the same JSONL format the real API returns.
+    """
+
+    def __init__(self, directory: str, responder):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.responder = responder
+
+    def submit(self, path: str) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        batch_dir = self.directory / batch_id
+        batch_dir.mkdir()
+        shutil.copy(path, batch_dir / "input.jsonl")
+
+        with open(batch_dir / "input.jsonl", "r", encoding="utf-8") as f_in, \
+                open(batch_dir / "output.jsonl", "w", encoding="utf-8") as f_out:
+            for line in f_in:
+                request = json.loads(line)
+                try:
+                    content = self.responder(request["body"])
+                    record = {
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {"choices": [{"message": {"role": "assistant", "content": content}}]},
+                        },
+                        "error": None,
+                    }
+                except Exception as e:
+                    record = {"custom_id": request["custom_id"], "response": None, "error": str(e)}
+                f_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        (batch_dir / "status").write_text("completed")
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        return (self.directory / batch_id / "status").read_text().strip()
+
+    def fetch_results(self, batch_id: str) -> dict[str, tuple[str, str]]:
+        with open(self.directory / batch_id / "output.jsonl", "r", encoding="utf-8") as f:
+            return parse_batch_output(f)
+
+
+def wait_for_batch(backend, batch_id: str, poll_interval: float = DEFAULT_POLL_INTERVAL) -> str:
+    """Poll until the batch reaches a terminal status and return that status."""
+    while True:
+        status = backend.status(batch_id)
+        if status in TERMINAL_STATUSES:
+            return status
+        print(f"Batch {batch_id} is {status}; checking again in {poll_interval:.0f}s")
+        time.sleep(poll_interval)
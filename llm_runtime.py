@@ -0,0 +1,213 @@
+"""
+Shared plumbing for calling LLM APIs from the analysis and generation scripts.
+
+Provides one pooled, keep-alive OpenAI client per process (with counters for
+how often connections are reused), a thread-safe request/token-per-minute
+rate limiter, and a retry helper with exponential backoff for rate-limit (429)
+and server (5xx) errors.
+"""
+
+import random
+import threading
+import time
+from functools import cache
+
+import httpx
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+
+DEFAULT_MAX_CONNECTIONS = 64
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 32
+DEFAULT_KEEPALIVE_EXPIRY = 60.0
+DEFAULT_TIMEOUT = 120.0
+
+# Error class names (from the openai package) that carry no status code but
+# are still worth retrying
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError"}
+
+
+class ConnectionStats:
+    """Counts HTTP requests and how many of them had to open a new connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.new_connections = 0
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_new_connection(self) -> None:
+        with self._lock:
+            self.new_connections += 1
+
+    def summary(self) -> str:
+        reused = max(0, self.requests - self.new_connections)
+        return (
+            f"{self.requests} requests, {self.new_connections} new connections, "
+            f"{reused} reused ({reused / self.requests:.0%})"
+            if self.requests
+            else "no requests"
+        )
+
+
+# Shared by every client from get_shared_client; reset at the start of a run
+connection_stats = ConnectionStats()
+
+
+def _trace(event_name: str, info: dict) -> None:
+    # httpcore emits connect_tcp events only when it opens a new connection
+    if event_name == "connection.connect_tcp.complete":
+        connection_stats.record_new_connection()
+
+
+def _on_request(request: httpx.Request) -> None:
+    connection_stats.record_request()
+    request.extensions["trace"] = _trace
+
+
+@cache
+def get_shared_client(
+    base_url: str = None,
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    max_keepalive_connections: int = DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+    timeout: float = DEFAULT_TIMEOUT,
+):
+    """
+    Return the process-wide OpenAI client for base_url, creating it on first use.
+
+    The client keeps a pool of keep-alive connections, so concurrent and
+    consecutive calls reuse TCP/TLS sessions instead of reconnecting. Its own
+    retries are disabled; wrap calls in call_with_retries instead.
+    """
+    from openai import OpenAI
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=timeout,
+        follow_redirects=True,
+        event_hooks={"request": [_on_request]},
+    )
+    return OpenAI(base_url=base_url, max_retries=0, http_client=http_client)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for rate limiting (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+class _TokenBucket:
+    """Bucket refilled continuously at limit_per_minute / 60 units per second."""
+
+    def __init__(self, limit_per_minute: float):
+        self.capacity = float(limit_per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # Requests larger than the whole bucket go through once it is full
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter on requests per minute and tokens per minute.
+
+    Either limit may be None to leave that dimension unthrottled.
+    """
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None):
+        self._requests = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Block until one request using `tokens` tokens fits within both limits."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                wait = 0.0
+                for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+                    if bucket is not None:
+                        bucket.refill(now)
+                        wait = max(wait, bucket.wait_time(amount))
+                if wait <= 0:
+                    for bucket, amount in ((self._requests, 1), (self._tokens, tokens)):
+                        if bucket is not None:
+                            bucket.level -= min(amount, bucket.capacity)
+                    return
+            time.sleep(wait)
+
+
+def _status_code(error: Exception):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def rejects_parameter(error: Exception, *names: str) -> bool:
+    """True if error is a 400 that names one of the given request parameters."""
+    if _status_code(error) != 400:
+        return False
+    param = getattr(error, "param", None) or ""
+    message = str(error)
+    return any(name in param or name in message for name in names)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """True for rate limits, timeouts, server errors and dropped connections."""
+    status = _status_code(error)
+    if status is not None:
+        return status in (408, 429) or status >= 500
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def _retry_after(error: Exception):
+    """Seconds requested by a Retry-After header, if the error carries one."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def call_with_retries(
+    request,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    base_delay: float = DEFAULT_BASE_DELAY,
+    max_delay: float = DEFAULT_MAX_DELAY,
+):
+    """
+    Call request() and retry retryable errors with jittered exponential backoff.
+
+    Non-retryable errors, and the last retryable one, are re-raised.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return request()
+        except Exception as e:
+            if attempt == max_retries or not is_retryable_error(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            delay = max(delay, _retry_after(e) or 0.0)
+            print(f"Retryable error ({e}); retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
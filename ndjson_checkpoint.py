@@ -0,0 +1,67 @@
+"""
+Append-only NDJSON checkpoints for long scoring and generation runs.
+
+Each finished result is written as one JSON line with an "id" field as soon as
+it is ready, so an interrupted run loses at most the results in flight and can
+be resumed by skipping ids already in the file.
+"""
+
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+def read_checkpoint(checkpoint_path: str) -> dict[str, int]:
+    """
+    Map each result id in an NDJSON checkpoint to its byte offset.
+
+    A trailing line cut off by a crash is dropped from the file so new results
+    can be appended after the last complete one.
+    """
+    offsets = {}
+    valid_end = 0
+    with open(checkpoint_path, "rb") as f:
+        offset = 0
+        for line in f:
+            try:
+                offsets[json.loads(line)["id"]] = offset
+                valid_end = offset + len(line)
+            except (json.JSONDecodeError, KeyError, TypeError):
+                break
+            offset += len(line)
+    if valid_end < os.path.getsize(checkpoint_path):
+        with open(checkpoint_path, "r+b") as f:
+            f.truncate(valid_end)
+    return offsets
+
+
+def score_to_checkpoint(units: list, score, checkpoint_path: str, concurrency: int) -> None:
+    """
+    Score work units on a bounded thread pool, appending each unit's results
+    to the NDJSON checkpoint as soon as it finishes.
+
+    score(unit) returns a list of result dicts. Only a small window of units
+    is submitted at a time, so finished results are written out rather than
+    held in memory.
+    """
+    max_workers = max(1, concurrency)
+    window = max_workers * 4
+    remaining = iter(units)
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, \
+            open(checkpoint_path, "a", encoding="utf-8") as f:
+        while True:
+            while len(pending) < window:
+                unit = next(remaining, None)
+                if unit is None:
+                    break
+                pending.add(executor.submit(score, unit))
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for result in future.result():
+                    f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            f.flush()
@@ -0,0 +1,294 @@
+"""
+Incremental runner for the data pipeline, from clustered questions to the backend mocks.
+
+Each stage declares the files it reads (including its own code and any saved
+state it reuses, such as projection layouts) and the files it writes. A stage
+depends on every stage that writes one of its inputs.
+Stages run as soon as their dependencies finish, with independent stages in
+parallel. A stage is skipped when the content hash of its inputs matches the
+last successful run and all of its outputs still exist. Hashes are kept in
+.pipeline_state.json. A table of per-stage timings is printed at the end.
+
+    python pipeline.py                  # run whatever is out of date
+    python pipeline.py combine          # only combine and the stages it needs
+    python pipeline.py --force analyze  # re-run analyze even if up to date
+    python pipeline.py --dry-run        # show what would run
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+STATE_FILE = ROOT_DIR / ".pipeline_state.json"
+
+
+@dataclass
+class Stage:
+    """A pipeline step: a script to run (or a Python callable) with declared inputs and outputs."""
+    name: str
+    inputs: list[str]
+    outputs: list[str]
+    script: str = None
+    action: object = None
+    args: list[str] = field(default_factory=list)
+
+    def run(self) -> str:
+        """Run the stage and return its captured output; raises on failure."""
+        if self.action is not None:
+            self.action()
+            return ""
+        completed = subprocess.run(
+            [sys.executable, self.script, *self.args],
+            cwd=ROOT_DIR,
+            capture_output=True,
+            text=True,
+            env={**os.environ, "MPLBACKEND": "Agg"},
+        )
+        output = completed.stdout + completed.stderr
+        if completed.returncode != 0:
+            raise RuntimeError(f"{self.script} exited with status {completed.returncode}\n{output}")
+        return output
+
+
+def _publish_analysis_results() -> None:
+    target = ROOT_DIR / "mocks" / "real_data" / "analysis_results.json"
+    target.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(ROOT_DIR / "analysis_results.json", target)
+
+
+STAGES = [
+    Stage(
+        name="fingerprints",
+        script="embedding copy.py",
+        inputs=[
+            "questions_with_clusters.csv", "embedding copy.py", "embedding_engine.py", "embedding_cache.py",
+            "fingerprints.py", "fingerprint_artifact.py", "projection.py",
+            # Saved layout that new points are placed into; also rewritten by this stage
+            "fingerprint_layout.npz",
+        ],
+        outputs=[
+            "questions_with_fingerprints_and_tsne", "questions_with_fingerprints.csv",
+            "fingerprint_layout.npz", "fingerprints_tsne_cluster1.png",
+        ],
+    ),
+    Stage(
+        name="cluster_embeddings",
+        script="embedding.py",
+        inputs=[
+            "questions_with_clusters.csv", "embedding.py", "embedding_engine.py", "embedding_cache.py", "projection.py",
+            "cluster_embedding_layout.npz",
+        ],
+        outputs=["cluster_embeddings_tsne.png", "cluster_embedding_layout.npz"],
+    ),
+    Stage(
+        name="cluster_tree",
+        script="tree_plot.py",
+        inputs=["questions_with_clusters.csv", "tree_plot.py"],
+        outputs=["topic_tree_plot.png"],
+    ),
+    Stage(
+        name="clusters_json",
+        script="backend/scripts/generate_clusters.py",
+        inputs=["memory-bank/questions_with_clusters.csv", "backend/scripts/generate_clusters.py"],
+        outputs=["mocks/clusters.json"],
+    ),
+    Stage(
+        name="combine",
+        script="combine_csvs.py",
+        # Bucket responses on disk so memory stays flat however many there are
+        args=["--streaming"],
+        inputs=[
+            "responses_with_system_prompts2.csv", "questions_with_fingerprints_and_tsne",
+            # Read instead of the artifact directory when that is absent
+            "questions_with_fingerprints_and_tsne.csv",
+            "combine_csvs.py", "fingerprint_artifact.py",
+        ],
+        outputs=["examples.csv"],
+    ),
+    Stage(
+        name="analyze",
+        script="llm_difference_analyzer.py",
+        inputs=[
+            "examples.csv", "llm_difference_analyzer.py", "llm_runtime.py", "llm_batch.py", "analysis_cache.py",
+            "structured_output.py", "ndjson_checkpoint.py", "prefilter.py", "local_scorer.py",
+        ],
+        outputs=["analysis_results.json"],
+    ),
+    Stage(
+        name="publish",
+        action=_publish_analysis_results,
+        inputs=["analysis_results.json"],
+        outputs=["mocks/real_data/analysis_results.json"],
+    ),
+]
+
+
+def hash_path(path: Path) -> str:
+    """Content hash of a file, or of every file under a directory; "missing" if absent."""
+    if not path.exists():
+        return "missing"
+    h = hashlib.sha256()
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    for file_path in files:
+        h.update(str(file_path.relative_to(path) if path.is_dir() else file_path.name).encode("utf-8"))
+        h.update(b"\0")
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()
+
+
+def stage_fingerprint(stage: Stage) -> str:
+    """Hash of everything that determines a stage's outputs."""
+    h = hashlib.sha256(json.dumps([stage.script, stage.args, stage.outputs]).encode("utf-8"))
+    for path in stage.inputs:
+        h.update(f"{path}={hash_path(ROOT_DIR / path)}".encode("utf-8"))
+    return h.hexdigest()
+
+
+def dependencies(stages: list[Stage]) -> dict[str, set[str]]:
+    """Map each stage name to the stages that write one of its inputs."""
+    writers = {output: stage.name for stage in stages for output in stage.outputs}
+    return {
+        stage.name: {writers[path] for path in stage.inputs if path in writers and writers[path] != stage.name}
+        for stage in stages
+    }
+
+
+def select_stages(stages: list[Stage], targets: list[str]) -> list[Stage]:
+    """The target stages plus everything upstream of them, in declaration order."""
+    by_name = {stage.name: stage for stage in stages}
+    unknown = [name for name in targets if name not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown stages {unknown}. Valid options: {list(by_name)}")
+
+    deps = dependencies(stages)
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(deps[name])
+    return [stage for stage in stages if stage.name in selected]
+
+
+def _load_state() -> dict:
+    if STATE_FILE.exists():
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def _save_state(state: dict) -> None:
+    tmp_file = f"{STATE_FILE}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, STATE_FILE)
+
+
+def run_pipeline(
+    stages: list[Stage] = None,
+    targets: list[str] = None,
+    force: list[str] = None,
+    max_workers: int = 4,
+    dry_run: bool = False,
+) -> bool:
+    """
+    Run out-of-date stages in dependency order, independent ones in parallel.
+
+    Args:
+        stages: Stage definitions (defaults to STAGES)
+        targets: Only run these stages and their upstream stages (default: all)
+        force: Re-run these stages even if their inputs are unchanged
+        max_workers: Maximum number of stages running at once
+        dry_run: Report what would run without running anything
+
+    Returns:
+        True if every selected stage succeeded or was up to date
+    """
+    stages = stages or STAGES
+    if targets:
+        stages = select_stages(stages, targets)
+    force = set(force or [])
+    deps = dependencies(stages)
+    state = _load_state()
+    state_lock = threading.Lock()
+
+    results = {}  # name -> (status, seconds)
+    remaining = {stage.name: stage for stage in stages}
+
+    def execute(stage: Stage, upstream_would_run: bool) -> tuple[str, float]:
+        fingerprint = stage_fingerprint(stage)
+        outputs_exist = all((ROOT_DIR / path).exists() for path in stage.outputs)
+        up_to_date = state.get(stage.name) == fingerprint and outputs_exist
+        if dry_run:
+            # Inputs written by an upstream stage that would run may change
+            return ("up to date" if up_to_date and not upstream_would_run and stage.name not in force
+                    else "would run"), 0.0
+        if up_to_date and stage.name not in force:
+            return "up to date", 0.0
+
+        print(f"[{stage.name}] running")
+        start = time.perf_counter()
+        try:
+            output = stage.run()
+        except Exception as e:
+            print(f"[{stage.name}] failed after {time.perf_counter() - start:.1f}s: {e}")
+            return "failed", time.perf_counter() - start
+        elapsed = time.perf_counter() - start
+        if output.strip():
+            print(f"[{stage.name}] output:\n{output.rstrip()}")
+        with state_lock:
+            # Hash again: a stage may rewrite its own inputs (e.g. caches)
+            state[stage.name] = stage_fingerprint(stage)
+            _save_state(state)
+        return "ran", elapsed
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while remaining or running:
+            for name in list(remaining):
+                if any(dep in remaining or dep in running.values() for dep in deps[name]):
+                    continue
+                if any(results.get(dep, ("",))[0] in ("failed", "blocked") for dep in deps[name]):
+                    results[name] = ("blocked", 0.0)
+                    del remaining[name]
+                    continue
+                upstream_would_run = any(results[dep][0] == "would run" for dep in deps[name])
+                running[executor.submit(execute, remaining.pop(name), upstream_would_run)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    print(f"\n{'stage':<20} {'status':<12} {'seconds':>8}")
+    for stage in stages:
+        status, seconds = results[stage.name]
+        print(f"{stage.name:<20} {status:<12} {seconds:>8.1f}")
+    return all(status not in ("failed", "blocked") for status, _ in results.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run out-of-date pipeline stages.")
+    parser.add_argument("targets", nargs="*", help=f"Stages to bring up to date: {[s.name for s in STAGES]}")
+    parser.add_argument("--force", nargs="*", default=[], help="Stages to re-run regardless of hashes")
+    parser.add_argument("--jobs", type=int, default=4, help="Maximum stages running in parallel")
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    success = run_pipeline(
+        targets=args.targets, force=args.force, max_workers=args.jobs, dry_run=args.dry_run
+    )
+    exit(0 if success else 1)
@@ -0,0 +1,114 @@
+"""
+Cheap local pre-scoring that keeps near-identical output pairs away from the LLM judge.
+
+Every pair gets two similarity signals computed locally:
+    cosine      Cosine similarity of the BERT mean-pooled embeddings of
+                output_A and output_B, computed in one batched pass
+    edit ratio  difflib similarity ratio of the two outputs' word tokens
+
+A pair counts as near-identical when both signals are at or above their
+thresholds. Such pairs are given low drift scores directly instead of an LLM
+call. A seeded sample of them is still sent to the LLM so the heuristic
+scores can be checked against the judge on every run.
+"""
+
+import difflib
+import random
+from dataclasses import dataclass
+
+import numpy as np
+
+DEFAULT_COSINE_THRESHOLD = 0.98
+DEFAULT_EDIT_RATIO_THRESHOLD = 0.85
+DEFAULT_CALIBRATION_SIZE = 10
+
+# A calibration pair whose LLM overall_diff is at least this high would have
+# been worth scoring, so skipping it was a miss
+CALIBRATION_MISS_LEVEL = 0.2
+
+
+@dataclass
+class PrefilterResult:
+    """Similarity signals for a list of pairs, and which of them to skip."""
+    cosine: np.ndarray
+    edit_ratio: np.ndarray
+    near_identical: np.ndarray  # bool mask: pair can be scored locally
+    calibration: set[int]  # near-identical pair indices to LLM-score anyway
+
+    def heuristic_drift(self, i: int) -> float:
+        """Local drift estimate for pair i: how far the less similar signal is from 1."""
+        return float(max(0.0, 1.0 - min(self.cosine[i], self.edit_ratio[i])))
+
+    def summary(self, i: int) -> str:
+        return (
+            f"Near-identical outputs (embedding cosine {self.cosine[i]:.3f}, "
+            f"edit ratio {self.edit_ratio[i]:.3f}); scored locally"
+        )
+
+
+def token_edit_ratio(text_A: str, text_B: str) -> float:
+    """difflib similarity ratio (0-1) between the lowercased word tokens of two texts."""
+    tokens_A = text_A.lower().split()
+    tokens_B = text_B.lower().split()
+    if not tokens_A and not tokens_B:
+        return 1.0
+    return difflib.SequenceMatcher(None, tokens_A, tokens_B, autojunk=False).ratio()
+
+
+def prefilter_pairs(
+    outputs_A: list[str],
+    outputs_B: list[str],
+    cosine_threshold: float = DEFAULT_COSINE_THRESHOLD,
+    edit_ratio_threshold: float = DEFAULT_EDIT_RATIO_THRESHOLD,
+    calibration_size: int = DEFAULT_CALIBRATION_SIZE,
+    random_state: int = 42,
+    **embed_kwargs,
+) -> PrefilterResult:
+    """
+    Compute similarity signals for every (output_A, output_B) pair.
+
+    Args:
+        outputs_A: First output of each pair
+        outputs_B: Second output of each pair
+        cosine_threshold: Minimum embedding cosine for a pair to be skipped
+        edit_ratio_threshold: Minimum token edit ratio for a pair to be skipped
+        calibration_size: Near-identical pairs to LLM-score anyway for calibration
+        random_state: Seed for choosing the calibration sample
+        **embed_kwargs: Passed to embedding_engine.paired_cosine_similarity (e.g. cache,
+            use_cache=False to skip the persistent embedding cache)
+
+    Returns:
+        PrefilterResult with one entry per pair
+    """
+    # Imported here so the analyzer only needs torch when pre-filtering is on
+    from embedding_engine import paired_cosine_similarity
+
+    print(f"Pre-filtering {len(outputs_A)} pairs...")
+    cosine = paired_cosine_similarity(outputs_A, outputs_B, show_progress=False, **embed_kwargs)
+    edit_ratio = np.array(
+        [token_edit_ratio(a, b) for a, b in zip(outputs_A, outputs_B)], dtype=np.float32
+    )
+    near_identical = (cosine >= cosine_threshold) & (edit_ratio >= edit_ratio_threshold)
+
+    candidates = np.flatnonzero(near_identical).tolist()
+    calibration = set(random.Random(random_state).sample(candidates, min(calibration_size, len(candidates))))
+    return PrefilterResult(cosine, edit_ratio, near_identical, calibration)
+
+
+def calibration_report(heuristic: dict[str, float], llm: dict[str, float]) -> str:
+    """
+    Compare heuristic drift with LLM overall_diff on the calibration sample.
+
+    Args:
+        heuristic: Pair id -> heuristic drift
+        llm: Pair id -> LLM overall_diff, for the same ids (failed pairs may be missing)
+    """
+    ids = [pair_id for pair_id in heuristic if pair_id in llm]
+    if not ids:
+        return "no calibration pairs scored"
+    errors = np.array([abs(heuristic[pair_id] - llm[pair_id]) for pair_id in ids])
+    misses = sum(llm[pair_id] >= CALIBRATION_MISS_LEVEL for pair_id in ids)
+    return (
+        f"{len(ids)} pairs, mean |heuristic - LLM| {errors.mean():.3f}, max {errors.max():.3f}, "
+        f"{misses} with LLM overall_diff >= {CALIBRATION_MISS_LEVEL} (would have been missed)"
+    )
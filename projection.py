@@ -0,0 +1,184 @@
+"""
+2-D projection of fingerprint / embedding matrices for the scatterplot.
+
+Two fitting methods are supported:
+    "tsne"  Barnes-Hut t-SNE with PCA initialization, optionally after a PCA
+            pre-reduction of the input, with neighbour search on all cores
+    "pca"   Plain 2-component PCA, near-instant for quick previews
+
+A fitted layout can be saved and reused. update_layout keeps every known
+point exactly where it was and places new points out-of-sample at the
+distance-weighted mean of their nearest neighbours in the input space. New
+questions therefore appear without moving old ones and without a full refit.
+"""
+
+import json
+import os
+from dataclasses import dataclass
+
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+from sklearn.neighbors import NearestNeighbors
+
+PROJECTION_METHODS = ("tsne", "pca")
+DEFAULT_NUM_NEIGHBORS = 10
+
+
+@dataclass
+class Layout:
+    """Input rows, their 2-D coordinates, and the key for each row."""
+    keys: list[str]
+    reference: np.ndarray
+    coordinates: np.ndarray
+
+    def save(self, path: str) -> None:
+        # Keys are stored as UTF-8 JSON bytes: a fixed-width string array would
+        # pad every key to the length of the longest one
+        keys_json = json.dumps(self.keys, ensure_ascii=False).encode("utf-8")
+        np.savez(
+            path,
+            keys_json=np.frombuffer(keys_json, dtype=np.uint8),
+            reference=self.reference,
+            coordinates=self.coordinates,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "Layout":
+        with np.load(path) as data:
+            if "keys_json" in data:
+                keys = json.loads(data["keys_json"].tobytes().decode("utf-8"))
+            else:  # Layouts saved before keys were stored as JSON
+                keys = data["keys"].tolist()
+            return cls(
+                keys=keys,
+                reference=data["reference"],
+                coordinates=data["coordinates"],
+            )
+
+
+def project_2d(
+    matrix: np.ndarray,
+    method: str = "tsne",
+    perplexity: float = 30,
+    max_iter: int = 1000,
+    pca_components: int = 50,
+    random_state: int = 42,
+    verbose: int = 0,
+) -> np.ndarray:
+    """
+    Fit a 2-D projection of every row of matrix.
+
+    Args:
+        matrix: (N, D) input matrix
+        method: One of PROJECTION_METHODS
+        perplexity: t-SNE perplexity (clamped below N)
+        max_iter: t-SNE iterations
+        pca_components: Reduce to this many dimensions before t-SNE when D is larger
+        random_state: Seed for reproducible layouts
+        verbose: t-SNE verbosity
+
+    Returns:
+        (N, 2) coordinates
+    """
+    if method not in PROJECTION_METHODS:
+        raise ValueError(f"Unknown projection method '{method}'. Valid options: {PROJECTION_METHODS}")
+
+    if method == "pca":
+        return PCA(n_components=2, random_state=random_state).fit_transform(matrix)
+
+    if pca_components and matrix.shape[1] > pca_components:
+        matrix = PCA(n_components=pca_components, random_state=random_state).fit_transform(matrix)
+
+    tsne = TSNE(
+        n_components=2,
+        method="barnes_hut",
+        init="pca",
+        perplexity=min(perplexity, len(matrix) - 1),
+        max_iter=max_iter,
+        random_state=random_state,
+        n_jobs=-1,
+        verbose=verbose,
+    )
+    return tsne.fit_transform(matrix)
+
+
+def place_out_of_sample(
+    layout: Layout,
+    matrix: np.ndarray,
+    num_neighbors: int = DEFAULT_NUM_NEIGHBORS,
+) -> np.ndarray:
+    """
+    Place new rows into an existing layout without moving its points.
+
+    Each new row lands at the inverse-distance-weighted mean of the coordinates
+    of its nearest reference rows.
+    """
+    num_neighbors = min(num_neighbors, len(layout.reference))
+    neighbors = NearestNeighbors(n_neighbors=num_neighbors).fit(layout.reference)
+    distances, indices = neighbors.kneighbors(matrix)
+
+    weights = 1.0 / np.maximum(distances, 1e-12)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.einsum("nk,nkd->nd", weights, layout.coordinates[indices])
+
+
+def update_layout(
+    keys: list[str],
+    matrix: np.ndarray,
+    layout_path: str = None,
+    refit: bool = False,
+    num_neighbors: int = DEFAULT_NUM_NEIGHBORS,
+    **project_kwargs,
+) -> np.ndarray:
+    """
+    Return 2-D coordinates for keys, reusing a saved layout where possible.
+
+    Keys already in the layout keep their coordinates; new keys are placed
+    out-of-sample. With no saved layout, or with refit=True, the whole matrix
+    is projected with project_2d. The updated layout is saved back to
+    layout_path when one is given.
+
+    Args:
+        keys: Identifier for each row of matrix (e.g. the question text)
+        matrix: (N, D) input matrix
+        layout_path: .npz file holding the saved Layout
+        refit: Ignore any saved layout and re-project everything
+        num_neighbors: Neighbours used for out-of-sample placement
+        **project_kwargs: Passed to project_2d on a full fit
+
+    Returns:
+        (N, 2) coordinates in the order of keys
+    """
+    keys = list(keys)
+    layout = None
+    if not refit and layout_path and os.path.exists(layout_path):
+        layout = Layout.load(layout_path)
+        if layout.reference.shape[1] != matrix.shape[1]:
+            # The cluster set changed, so old coordinates are not comparable
+            print("Saved layout has a different dimensionality, refitting")
+            layout = None
+
+    if layout is None:
+        print(f"Projecting {len(keys)} points...")
+        coordinates = project_2d(matrix, **project_kwargs)
+        layout = Layout(keys=keys, reference=np.asarray(matrix), coordinates=coordinates)
+    else:
+        key_to_row = {key: i for i, key in enumerate(layout.keys)}
+        new_rows = [i for i, key in enumerate(keys) if key not in key_to_row]
+        print(f"Reusing layout for {len(keys) - len(new_rows)} points, placing {len(new_rows)} new points")
+
+        if new_rows:
+            new_coordinates = place_out_of_sample(layout, matrix[new_rows], num_neighbors)
+            layout = Layout(
+                keys=layout.keys + [keys[i] for i in new_rows],
+                reference=np.vstack([layout.reference, matrix[new_rows]]),
+                coordinates=np.vstack([layout.coordinates, new_coordinates]),
+            )
+            key_to_row = {key: i for i, key in enumerate(layout.keys)}
+
+        coordinates = layout.coordinates[[key_to_row[key] for key in keys]]
+
+    if layout_path:
+        layout.save(layout_path)
+    return coordinates
@@ -0,0 +1,157 @@
+"""
+Structured-output handling for LLM judge responses.
+
+Provides the JSON schemas used to request schema-constrained output, a
+tolerant extractor that recovers JSON from fenced or chatty replies (and
+repairs the most common syntax slips, such as missing or trailing commas),
+and counters for how often responses parse cleanly, need repair, or fail.
+"""
+
+import json
+import re
+import threading
+
+# Score fields every analysis result must contain
+SCORE_FIELDS = ["semantic_drift", "emotional_drift", "political_drift", "sycophancy_drift", "trait_drift"]
+
+# Supported values for the response_format mode
+RESPONSE_FORMAT_MODES = ("json_schema", "json_object", None)
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+# A value ending one line followed by a quoted key on the next, with no comma between
+_MISSING_COMMA_RE = re.compile(r'(["\d\]}]|true|false|null)(\s*\n\s*")')
+
+
+def analysis_result_schema(with_index: bool = False) -> dict:
+    """JSON schema for one analysis result object."""
+    properties = {field: {"type": "number"} for field in SCORE_FIELDS}
+    properties["summary"] = {"type": "string"}
+    properties["adjectives"] = {"type": "array", "items": {"type": "string"}}
+    if with_index:
+        properties = {"index": {"type": "integer"}, **properties}
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+def response_format(mode: str, packed: bool = False):
+    """
+    Build the response_format request parameter for mode.
+
+    Args:
+        mode: One of RESPONSE_FORMAT_MODES; None sends no response_format
+        packed: Request the packed {"results": [...]} shape instead of one object
+
+    Returns:
+        The response_format dict, or None
+    """
+    if mode not in RESPONSE_FORMAT_MODES:
+        raise ValueError(f"Unknown response format mode '{mode}'. Valid options: {RESPONSE_FORMAT_MODES}")
+    if mode is None:
+        return None
+    if mode == "json_object":
+        return {"type": "json_object"}
+
+    if packed:
+        name = "packed_difference_scores"
+        schema = {
+            "type": "object",
+            "properties": {"results": {"type": "array", "items": analysis_result_schema(with_index=True)}},
+            "required": ["results"],
+            "additionalProperties": False,
+        }
+    else:
+        name = "difference_scores"
+        schema = analysis_result_schema()
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+
+def _repair(text: str) -> str:
+    text = _TRAILING_COMMA_RE.sub(r"\1", text)
+    return _MISSING_COMMA_RE.sub(r"\1,\2", text)
+
+
+def _candidates(text: str):
+    """Substrings of text that may hold the JSON payload, most likely first."""
+    for match in _FENCE_RE.finditer(text):
+        yield match.group(1).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if starts:
+        start = min(starts)
+        end = text.rfind("}" if text[start] == "{" else "]")
+        if end > start:
+            yield text[start:end + 1]
+
+
+def extract_json(text: str):
+    """
+    Decode the JSON payload of an LLM reply.
+
+    Tries the reply as-is first, then any ```json fenced blocks, then the span
+    from the first opening brace or bracket to the last matching closer, each
+    also with missing and trailing commas repaired.
+
+    Returns:
+        (data, repaired) where repaired is False only if the reply was valid JSON as-is
+
+    Raises:
+        ValueError: If no JSON could be recovered
+    """
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError as e:
+        error = e
+
+    for candidate in _candidates(text):
+        for attempt in (candidate, _repair(candidate)):
+            try:
+                return json.loads(attempt, strict=False), True
+            except json.JSONDecodeError:
+                continue
+    raise ValueError(f"No valid JSON found in response ({error})")
+
+
+class ParseStats:
+    """Counts how judge responses were handled over a run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.clean = 0
+            self.repaired = 0
+            self.invalid = 0
+            self.request_errors = 0
+            self.split_packs = 0
+            self.requeued = 0
+            self.gave_up = 0
+
+    def record(self, outcome: str, count: int = 1) -> None:
+        """Add count to one of the counters above, by attribute name."""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + count)
+
+    def failure_rate(self) -> float:
+        total = self.clean + self.repaired + self.invalid
+        return self.invalid / total if total else 0.0
+
+    def summary(self) -> str:
+        total = self.clean + self.repaired + self.invalid
+        if not total and not self.request_errors:
+            return "no responses"
+        return (
+            f"{total} responses: {self.clean} clean, {self.repaired} repaired, {self.invalid} invalid "
+            f"({self.failure_rate():.1%} failure rate); {self.request_errors} request errors, "
+            f"{self.split_packs} packs split, {self.requeued} pairs re-queued, "
+            f"{self.gave_up} left with default scores"
+        )
+
+
+# Shared by all analysis calls; reset at the start of a run
+parse_stats = ParseStats()